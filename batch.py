@@ -0,0 +1,235 @@
+# batch.py
+# Batch fault injection over many designs in a pool of worker processes.
+
+import os
+import glob
+import json
+import time
+import signal
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+from .config import FaultInjConfig
+from .instrument import recorder
+
+VERILOG_SUFFIXES = (".v", ".sv")
+FILELIST_SUFFIXES = (".f", ".lst")
+
+
+def is_batch_input(spec: str) -> bool:
+    """
+    True if `spec` names several designs: a directory, a glob pattern,
+    or a filelist (`@list.txt`, `*.f`, `*.lst`).
+    """
+    return (os.path.isdir(spec) or glob.has_magic(spec)
+            or spec.startswith("@") or spec.endswith(FILELIST_SUFFIXES))
+
+
+def expand_inputs(spec: str) -> list[str]:
+    """
+    Expand a batch input spec into the list of design files.
+    A directory yields its .v/.sv files, a glob its matches, and a filelist
+    one path per non-empty line (`#` starts a comment; relative paths are
+    taken relative to the filelist).
+    """
+    if os.path.isdir(spec):
+        return sorted(
+            os.path.join(spec, name) for name in os.listdir(spec)
+            if name.endswith(VERILOG_SUFFIXES) and os.path.isfile(os.path.join(spec, name))
+        )
+    if glob.has_magic(spec):
+        return sorted(path for path in glob.glob(spec, recursive=True) if os.path.isfile(path))
+
+    filelist = spec[1:] if spec.startswith("@") else spec
+    base_dir = os.path.dirname(os.path.abspath(filelist))
+    designs = []
+    with open(filelist, "r") as f:
+        for entry in f:
+            entry = entry.split("#", 1)[0].strip()
+            if entry:
+                designs.append(entry if os.path.isabs(entry) else os.path.join(base_dir, entry))
+    return designs
+
+
+def output_names(input_files: list[str]) -> list[str]:
+    """
+    Derive a unique output name per design from its file name.
+    """
+    names = []
+    seen = {}
+    for path in input_files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        count = seen.get(stem, 0)
+        seen[stem] = count + 1
+        names.append(stem if count == 0 else f"{stem}_{count}")
+    return names
+
+
+def run_design(input_file: str, output_path: str, config: FaultInjConfig) -> dict:
+    """
+    Inject faults into a single design and return its summary entry.
+    Perturbed Verilog is written to `output_path`; with `config.svm` the
+    mutants go to the `output_path` directory instead.
+    """
+    # imported here so a worker pays for pyverilog once, not per design
+    from .inject import fault_inject, fault_inject_svm
+
+    entry = {"input": input_file, "output": output_path, "status": "ok"}
+    time_start = time.time()
+    try:
+        if config.svm:
+            os.makedirs(output_path, exist_ok=True)
+            metadata = fault_inject_svm(input_file, output_path, seed=config.seed, prune=config.prune_dead_sites,
+                                        pack=config.pack_mutants, large_file=config.large_file,
+                                        budget=config.mutant_budget, quotas=config.category_quotas,
+                                        engine=config.svm_engine)
+            entry["mutants"] = len(metadata)
+        else:
+            perturbed_verilog = fault_inject([input_file], config)
+            with open(output_path, "w") as f:
+                f.write(perturbed_verilog)
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["elapsed"] = time.time() - time_start
+    return entry
+
+
+def _batch_worker(conn, trace=False):
+    """
+    Worker process: run the designs received on `conn` until it is closed,
+    sending back each design's entry with what was recorded while running
+    it (see Recorder.drain) if `trace` is set.
+    """
+    # a process group of its own, so that killing it also stops the
+    # preprocessor it may be waiting on
+    os.setpgrp()
+    recorder.reset()
+    recorder.enabled = trace
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        index, args = task
+        entry = run_design(*args)
+        conn.send((index, entry, recorder.drain() if trace else None))
+
+
+class _Worker:
+    """
+    A worker process and the design it is running, if any.
+    """
+    def __init__(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_batch_worker, args=(child, recorder.enabled), daemon=True)
+        self.process.start()
+        child.close()
+        self.index = None
+        self.started = None
+
+    def submit(self, index, args):
+        self.conn.send((index, args))
+        self.index = index
+        self.started = time.time()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+def run_batch(input_files: list[str], output_dir: str, config: FaultInjConfig,
+              jobs=None, timeout=None, report_path=None) -> dict:
+    """
+    Run fault injection for every design on a pool of `jobs` worker processes
+    (None: one per core), each design limited to `timeout` seconds.
+    The timeout is enforced from here: a worker still busy with a design
+    when it expires is killed (whatever it is stuck in, pyverilog or the
+    preprocessor) and replaced.
+    Returns the summary report, which is also written to `report_path`
+    (default: batch_report.json in `output_dir`).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if report_path is None:
+        report_path = os.path.join(output_dir, "batch_report.json")
+
+    outputs = []
+    for name in output_names(input_files):
+        outputs.append(os.path.join(output_dir, name if config.svm else f"{name}_perturbed.v"))
+
+    time_start = time.time()
+    designs = [None] * len(input_files)
+    pending = deque(enumerate(zip(input_files, outputs)))
+    jobs = jobs if jobs is not None else os.cpu_count()
+    workers = [_Worker() for _ in range(min(jobs, len(pending)))]
+    done = 0
+    try:
+        while done < len(designs):
+            for worker in workers:
+                if worker.index is None and pending:
+                    index, (input_file, output_path) = pending.popleft()
+                    worker.submit(index, (input_file, output_path, config))
+            busy = [worker for worker in workers if worker.index is not None]
+            wait_time = None
+            if timeout:
+                wait_time = max(0.0, min(worker.started for worker in busy) + timeout - time.time())
+            ready = wait([worker.conn for worker in busy], wait_time)
+            for slot, worker in enumerate(workers):
+                if worker.index is None:
+                    continue
+                index = worker.index
+                entry = None
+                if worker.conn in ready:
+                    try:
+                        _, entry, recording = worker.conn.recv()
+                        worker.index = None
+                        recorder.merge(recording)
+                    except EOFError:
+                        # the worker died with the design (e.g. a crash in C code)
+                        entry = {"input": input_files[index], "output": outputs[index], "status": "error",
+                                 "error": f"worker exited with code {worker.process.exitcode}"}
+                elif timeout and time.time() - worker.started >= timeout:
+                    entry = {"input": input_files[index], "output": outputs[index], "status": "timeout"}
+                if entry is None:
+                    continue
+                if worker.index is not None:
+                    worker.kill()
+                    workers[slot] = _Worker()
+                    entry["elapsed"] = time.time() - worker.started
+                designs[index] = entry
+                done += 1
+                recorder.count(f"designs.{entry['status']}")
+                recorder.log(f"[{done}/{len(designs)}] {entry['status']}: {entry['input']} ({entry['elapsed']:.1f}s)")
+    finally:
+        for worker in workers:
+            worker.close()
+
+    report = {
+        "total": len(designs),
+        "ok": sum(entry["status"] == "ok" for entry in designs),
+        "error": sum(entry["status"] == "error" for entry in designs),
+        "timeout": sum(entry["status"] == "timeout" for entry in designs),
+        "elapsed": time.time() - time_start,
+        "designs": designs,
+    }
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,238 @@
+# benchmark.py
+# Benchmark harness over synthetic Verilog designs of configurable size.
+#
+# Every stage of the tool is timed on the same generated design: parsing,
+# each perturbation strategy on its own, code generation and SmartVerilog
+# mutant generation. Results are written as JSON, tagged with the commit
+# they were measured on, so that runs can be compared across commits:
+#
+#   python -m faultinj.benchmark --lines 1000 10000 100000 --output bench.json
+
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+import pyverilog
+
+from .config import FaultInjConfig
+from .frontend import parse_text, get_parser, get_codegenerator
+from .perturbations import Perturber
+from .mutation import SmartVerilogMutation
+
+# every strategy defined, so that a new one is timed without being listed here
+STRATEGIES = tuple(strategy for strategy in Perturber.__subclasses__() if strategy.name)
+GATES = ("and", "or", "nand", "nor", "xor", "xnor")
+WIDTH = 8
+
+# per-module counts of the default design shape, about 300 lines a module
+MODULE_SHAPE = {"assigns": 60, "always_blocks": 12, "constants": 10, "gates": 20}
+
+
+def synthetic_module(name, assigns, always_blocks, constants, gates, rng):
+    """
+    Return the lines of one synthetic module: constant wires, a chain of
+    continuous assigns, clocked always blocks with if/else-if/else logic,
+    and gate primitive instances.
+    """
+    lines = [
+        f"module {name}(",
+        "  input wire clk,",
+        "  input wire rst_n,",
+        f"  input wire [{WIDTH - 1}:0] in_a,",
+        f"  input wire [{WIDTH - 1}:0] in_b,",
+        f"  output wire [{WIDTH - 1}:0] out_data,",
+        "  output wire out_bit",
+        ");",
+    ]
+    wires = ["in_a", "in_b"]
+    for j in range(constants):
+        lines.append(f"  wire [{WIDTH - 1}:0] k{j} = {WIDTH}'b{rng.randrange(1 << WIDTH):0{WIDTH}b};")
+        wires.append(f"k{j}")
+    for j in range(assigns):
+        lines.append(f"  wire [{WIDTH - 1}:0] w{j};")
+    for j in range(assigns):
+        a, b = rng.choice(wires), rng.choice(wires)
+        op = rng.choice(("&", "|", "^", "+", "-"))
+        const = rng.randrange(1 << WIDTH)
+        lines.append(f"  assign w{j} = ({a} {op} {b}) ^ {WIDTH}'h{const:02x};")
+        wires.append(f"w{j}")
+
+    regs = []
+    for j in range(always_blocks):
+        lines.append(f"  reg [{WIDTH - 1}:0] r{j};")
+    for j in range(always_blocks):
+        a, b, c = rng.choice(wires), rng.choice(wires), rng.choice(wires)
+        lines += [
+            "  always @(posedge clk or negedge rst_n) begin",
+            "    if (!rst_n) begin",
+            f"      r{j} <= {WIDTH}'h00;",
+            f"    end else if ({a} == {WIDTH}'d{rng.randrange(1 << WIDTH)}) begin",
+            f"      r{j} <= {b} + {WIDTH}'d1;",
+            "    end else begin",
+            f"      r{j} <= r{j} ^ {c};",
+            "    end",
+            "  end",
+        ]
+        regs.append(f"r{j}")
+
+    bits = []
+    for j in range(gates):
+        lines.append(f"  wire g{j};")
+    for j in range(gates):
+        a, b = rng.choice(wires + regs), rng.choice(wires + regs)
+        lines.append(f"  {rng.choice(GATES)} u_g{j} (g{j}, {a}[{rng.randrange(WIDTH)}], {b}[{rng.randrange(WIDTH)}]);")
+        bits.append(f"g{j}")
+
+    out_bit = " | ".join(bits[-4:]) if bits else "1'b0"
+    lines.append(f"  assign out_data = {' ^ '.join((regs or wires)[-4:])};")
+    lines.append(f"  assign out_bit = {out_bit};")
+    lines.append("endmodule")
+    lines.append("")
+    return lines
+
+
+def synthetic_design(modules=1, assigns=60, always_blocks=12, constants=10, gates=20, seed=0):
+    """
+    Return the text of a synthetic design of `modules` modules of the given
+    shape. The same arguments always give the same design.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(modules):
+        lines += synthetic_module(f"bench_m{i}", assigns, always_blocks, constants, gates, rng)
+    return "\n".join(lines)
+
+
+def design_for_lines(target_lines, seed=0):
+    """
+    Return a design of the default shape with about `target_lines` lines.
+    """
+    sample = synthetic_design(1, seed=seed, **MODULE_SHAPE).count("\n") + 1
+    return synthetic_design(max(1, round(target_lines / sample)), seed=seed, **MODULE_SHAPE)
+
+
+def _timed(func, repeat, setup=None):
+    """
+    Run `func` `repeat` times (on a fresh `setup()` result each time, if
+    given) and return the timing summary in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        time_start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - time_start)
+    return {"min": min(times), "median": statistics.median(times), "runs": len(times)}
+
+
+def benchmark_design(text, repeat=3, svm=True, seed=0):
+    """
+    Time every stage on one design and return the timings by stage.
+    """
+    timings = {}
+    timings["parse"] = _timed(lambda: parse_text(text), repeat)
+
+    ast, _ = parse_text(text)
+    try:
+        snapshot = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
+        fresh_ast = lambda: pickle.loads(snapshot)
+    except RecursionError:
+        fresh_ast = lambda: parse_text(text)[0]
+
+    config = FaultInjConfig(seed=seed)
+    for strategy in STRATEGIES:
+        perturber = strategy(config=config)
+        timings[f"perturb.{strategy.name}"] = _timed(perturber.apply, repeat, setup=fresh_ast)
+
+    codegenerator = get_codegenerator()
+    timings["codegen"] = _timed(lambda: codegenerator.visit(ast), repeat)
+
+    if svm:
+        with tempfile.TemporaryDirectory(prefix="faultinj_bench_") as tmp:
+            input_file = os.path.join(tmp, "design.v")
+            with open(input_file, "w") as f:
+                f.write(text)
+
+            def generate():
+                tool = SmartVerilogMutation(input_file, os.path.join(tmp, "mutants"), write_mutants=False, seed=seed)
+                tool.run()
+            timings["svm.generate_mutants"] = _timed(generate, repeat)
+    return timings
+
+
+def _commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(sizes, repeat=3, svm=True, seed=0):
+    """
+    Benchmark a design of each size (in lines) and return the report.
+    """
+    # building the parser tables is a one-off cost, kept out of the parse timings
+    time_start = time.perf_counter()
+    get_parser()
+    parser_setup = time.perf_counter() - time_start
+
+    results = []
+    for target_lines in sizes:
+        text = design_for_lines(target_lines, seed=seed)
+        lines = text.count("\n") + 1
+        print(f"Benchmarking a design of {lines} lines...")
+        timings = benchmark_design(text, repeat=repeat, svm=svm, seed=seed)
+        for stage, timing in timings.items():
+            print(f"  {stage}: {timing['median']:.3f}s")
+        results.append({
+            "target_lines": target_lines,
+            "lines": lines,
+            "bytes": len(text),
+            "timings": timings,
+        })
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pyverilog": pyverilog.__version__,
+        "repeat": repeat,
+        "seed": seed,
+        "parser_setup": parser_setup,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fault injection tool on synthetic designs")
+    parser.add_argument("--lines", "-l", type=int, nargs="+", default=[1000, 10000], help="Design sizes, in lines")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Runs per stage (the median and minimum are reported)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the design generator and the perturbations")
+    parser.add_argument("--no-svm", action="store_true", help="Skip SmartVerilog mutant generation")
+    parser.add_argument("--emit", default=None, help="Only write the design of the first size to this file")
+    parser.add_argument("--output", "-o", default="benchmark.json", help="JSON results file")
+    args = parser.parse_args()
+
+    if args.emit:
+        with open(args.emit, "w") as f:
+            f.write(design_for_lines(args.lines[0], seed=args.seed))
+        print(f"Synthetic design written to {args.emit}")
+        return
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 16 * 1024))
+    report = run_benchmarks(args.lines, repeat=args.repeat, svm=not args.no_svm, seed=args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
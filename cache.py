@@ -0,0 +1,224 @@
+# cache.py
+# On-disk cache of preprocessed and parsed Verilog.
+#
+# Entries are keyed by a content hash of everything that determines the
+# parse: the input file contents, the headers they may include, the include
+# paths and the defines. Each entry holds the preprocessed text and, when the
+# AST can be pickled, the parsed AST and directives.
+
+import os
+import re
+import pickle
+import hashlib
+import tempfile
+
+import pyverilog
+
+from .utils import mask_comments
+
+CACHE_DIR_ENV = "FAULTINJ_CACHE_DIR"
+CACHE_SIZE_ENV = "FAULTINJ_CACHE_MB"
+DEFAULT_MAX_BYTES = 1 << 30
+
+INCLUDE_RE = re.compile(r"`include\b")
+# the file name after `include, read from the unmasked text
+INCLUDE_NAME_RE = re.compile(r'\s*(?:"([^"\n]+)"|<([^>\n]+)>)')
+
+
+def included_names(path):
+    """
+    Yield the file name of every `include of a Verilog file outside comments,
+    or None for an include that is not a literal name (e.g. a macro).
+    """
+    with open(path, "rb") as f:
+        text = f.read().decode(errors="replace")
+    for m in INCLUDE_RE.finditer(mask_comments(text)):
+        name = INCLUDE_NAME_RE.match(text, m.end())
+        yield (name.group(1) or name.group(2)) if name else None
+
+
+def include_closure(input_files, include=None):
+    """
+    Return the headers the input files may include, transitively, as
+    {path: sha256 digest, or None if missing}, and whether some include
+    could not be resolved statically.
+    Every place a header may be found counts, whether or not the file is
+    there: the directory of the including file, the working directory and
+    each include path. Includes are followed regardless of `ifdef, so the
+    result covers every header the preprocessor can open.
+    """
+    headers = {}
+    unresolved = False
+    visited = set()
+    pending = [os.path.abspath(path) for path in input_files]
+    while pending:
+        path = pending.pop()
+        if path in visited:
+            continue
+        visited.add(path)
+        for name in included_names(path):
+            if name is None:
+                unresolved = True
+                continue
+            if os.path.isabs(name):
+                candidates = [name]
+            else:
+                directories = [os.path.dirname(path), os.getcwd()] + list(include or ())
+                candidates = [os.path.join(directory, name) for directory in directories]
+            for candidate in candidates:
+                candidate = os.path.abspath(candidate)
+                if candidate in headers:
+                    continue
+                if os.path.isfile(candidate):
+                    with open(candidate, "rb") as f:
+                        headers[candidate] = hashlib.sha256(f.read()).hexdigest()
+                    pending.append(candidate)
+                else:
+                    headers[candidate] = None
+    return headers, unresolved
+
+
+def _tree_listing(h, directory):
+    """
+    Fold the size and mtime of every file under `directory` into hash `h`.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            h.update(f"{path}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+
+
+class ParseCache:
+    """
+    Size-bounded LRU cache of preprocessed text and pickled ASTs.
+    Recency is tracked through file modification times, which are refreshed
+    on every hit; the least recently used entries are evicted once the cache
+    grows beyond `max_bytes`. Writes are atomic, so several processes can
+    share one cache directory.
+    """
+    TEXT_SUFFIX = ".pp.v"
+    AST_SUFFIX = ".ast.pkl"
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, input_files: list[str], include=None, define=None) -> str:
+        """
+        Hash the inputs of a parse into a cache key.
+        """
+        h = hashlib.sha256()
+        h.update(f"pyverilog={pyverilog.__version__}\n".encode())
+        for path in input_files:
+            h.update(f"file={path}\n".encode())
+            with open(path, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        for inc in include or ():
+            h.update(f"include={inc}\n".encode())
+        headers, unresolved = include_closure(input_files, include)
+        for header in sorted(headers):
+            h.update(f"header={header}:{headers[header] or 'missing'}\n".encode())
+        if unresolved:
+            # an include through a macro may name any file: fold in the size
+            # and mtime of everything it could reach
+            h.update(b"unresolved\n")
+            for directory in sorted({os.path.dirname(os.path.abspath(path)) for path in input_files}
+                                    | set(include or ())):
+                _tree_listing(h, directory)
+        for dfn in define or ():
+            h.update(f"define={dfn}\n".encode())
+        return h.hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _read(self, path, mode):
+        try:
+            with open(path, mode) as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # mark as recently used
+        return data
+
+    def _write(self, path, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_text(self, key):
+        """
+        Return the cached preprocessed text, or None.
+        """
+        return self._read(self._path(key, self.TEXT_SUFFIX), "r")
+
+    def get_ast(self, key):
+        """
+        Return the cached (ast, directives), or None.
+        """
+        data = self._read(self._path(key, self.AST_SUFFIX), "rb")
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def put(self, key, text, ast=None, directives=()):
+        """
+        Store the preprocessed text and, if given, the parse result.
+        """
+        self._write(self._path(key, self.TEXT_SUFFIX), text.encode())
+        if ast is not None:
+            try:
+                data = pickle.dumps((ast, directives), protocol=pickle.HIGHEST_PROTOCOL)
+            except RecursionError:
+                # very deep expression trees exceed the pickler's recursion
+                # limit; the preprocessed text is still worth keeping
+                data = None
+            if data is not None:
+                self._write(self._path(key, self.AST_SUFFIX), data)
+        self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used files until the cache fits in max_bytes.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith((self.TEXT_SUFFIX, self.AST_SUFFIX)):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def default_cache():
+    """
+    Return the cache configured through $FAULTINJ_CACHE_DIR (bounded by
+    $FAULTINJ_CACHE_MB megabytes), or None.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    size_mb = os.environ.get(CACHE_SIZE_ENV)
+    return ParseCache(cache_dir, int(float(size_mb) * (1 << 20)) if size_mb else DEFAULT_MAX_BYTES)
@@ -3,7 +3,7 @@
 # Author: Adwait Godbole (adwait@berkeley.edu)
 
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Literal, Optional, Union
 import json
 
 class FaultInjConfig(BaseModel):
@@ -12,6 +12,14 @@ class FaultInjConfig(BaseModel):
     invert_logic: bool = Field(default=True, description="Invert logic in always blocks (e.g., if (a) -> if (!a))")
     change_constants: bool = Field(default=True, description="Change constants (e.g., assign x = 1'b0 -> assign x = 1'b1)")
     randomize_assignments: bool = Field(default=False, description="Randomize assignment targets or values")
+    mutate_operators: bool = Field(default=False, description="Replace binary operators with another of the same kind (e.g., a & b -> a | b, a < b -> a >= b)")
+    svm_engine: Literal["regex", "ast"] = Field(default="regex", description="How SmartVerilog mutates operators: regex rules on the text, or operator swaps on the parsed AST (skips comments, strings and `<=` assignments)")
+    incremental_codegen: bool = Field(default=False, description="Splice only the perturbed code into the original source instead of regenerating the whole design")
+    prune_dead_sites: bool = Field(default=False, description="Skip mutation sites outside the output cone of influence (pyverilog dataflow analysis)")
+    pack_mutants: bool = Field(default=False, description="Write SmartVerilog mutants into a single indexed archive (mutants.pack) instead of one file each")
+    large_file: bool = Field(default=False, description="Memory-map the SmartVerilog input and write mutants with kernel range copies from it (huge netlists)")
+    mutant_budget: Optional[int] = Field(default=None, description="Keep at most this many SmartVerilog mutants, sampled evenly across categories")
+    category_quotas: Optional[Union[int, dict[str, int]]] = Field(default=None, description="Keep at most this many SmartVerilog mutants per category (one count for all, or by category)")
     seed: Optional[int] = Field(default=None, description="Random seed for reproducibility")
 
     @classmethod
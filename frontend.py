@@ -0,0 +1,96 @@
+# frontend.py
+# Verilog parsing front end shared by the injection entry points.
+#
+# Building pyverilog's lexer and LALR tables and loading the code generator's
+# templates is expensive, so one parser and one code generator are kept per
+# process and reused across parses. They are not thread-safe.
+
+import os
+import tempfile
+from pyverilog.vparser.parser import VerilogParser
+from pyverilog.vparser.preprocessor import VerilogPreprocessor
+from pyverilog.ast_code_generator.codegen import ASTCodeGenerator
+
+from .cache import default_cache
+from .instrument import recorder
+
+_parser = None
+_codegenerator = None
+
+
+def get_parser() -> VerilogParser:
+    """
+    Return the process-wide VerilogParser, building it on first use.
+    """
+    global _parser
+    if _parser is None:
+        _parser = VerilogParser()
+    return _parser
+
+
+def get_codegenerator() -> ASTCodeGenerator:
+    """
+    Return the process-wide ASTCodeGenerator, whose template cache persists
+    across calls.
+    """
+    global _codegenerator
+    if _codegenerator is None:
+        _codegenerator = ASTCodeGenerator()
+    return _codegenerator
+
+
+def preprocess_verilog(input_files: list[str], include=None, define=None) -> str:
+    """
+    Run the Verilog preprocessor over the input files and return its output.
+    The output goes to a private temporary file, so several preprocessor runs
+    can happen side by side in one directory.
+    """
+    fd, preprocess_output = tempfile.mkstemp(prefix="faultinj_", suffix=".pp.v")
+    os.close(fd)
+    try:
+        with recorder.span("preprocess", files=len(input_files)):
+            VerilogPreprocessor(input_files, preprocess_output, include, define).preprocess()
+        with open(preprocess_output, "r") as f:
+            return f.read()
+    finally:
+        os.remove(preprocess_output)
+
+
+def parse_text(text: str):
+    """
+    Parse preprocessed Verilog text with the shared parser, returning
+    (ast, directives).
+    """
+    parser = get_parser()
+    # the lexer keeps per-file state that pyverilog never resets
+    parser.lexer.reset_lineno()
+    parser.lexer.directives = []
+    parser.lexer.default_nettype = "wire"
+    with recorder.span("parse", bytes=len(text)):
+        ast = parser.parse(text)
+    return ast, parser.get_directives()
+
+
+def parse_verilog(input_files: list[str], include=None, define=None, cache=None):
+    """
+    Preprocess and parse the input Verilog files, returning (ast, directives).
+    The cache (by default the one configured through $FAULTINJ_CACHE_DIR) is
+    consulted first: a hit skips the parse, or at least the preprocessor.
+    """
+    if cache is None:
+        cache = default_cache()
+    if cache is None:
+        return parse_text(preprocess_verilog(input_files, include, define))
+
+    key = cache.key(input_files, include, define)
+    parsed = cache.get_ast(key)
+    if parsed is not None:
+        recorder.count("cache.hit")
+        return parsed
+    recorder.count("cache.miss")
+    text = cache.get_text(key)
+    if text is None:
+        text = preprocess_verilog(input_files, include, define)
+    ast, directives = parse_text(text)
+    cache.put(key, text, ast, directives)
+    return ast, directives
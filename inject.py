@@ -4,54 +4,221 @@
 # Author: Adwait Godbole (adwait@berkeley.edu)
 
 import os
+import random
+import pickle
 import argparse
-from pyverilog.vparser.parser import parse
-from pyverilog.ast_code_generator.codegen import ASTCodeGenerator
-
 from .config import FaultInjConfig
+from .frontend import parse_verilog, get_codegenerator
+from .batch import is_batch_input, expand_inputs, run_batch
+from .server import DEFAULT_SOCKET, submit
+from .cache import CACHE_DIR_ENV, CACHE_SIZE_ENV
 from .perturbations import *
+from .utils import derive_rng
+from .splice import Splicer, splice_edits
+from .prune import ConeOfInfluence
 from .mutation import SmartVerilogMutation
+from .table import MutantTable
+from .instrument import recorder
 
 
-def fault_inject(input_files: list[str], config: FaultInjConfig) -> str:
+def apply_perturbations(ast, config: FaultInjConfig, edits: list = None, cone: ConeOfInfluence = None):
+    """
+    Apply the perturbations enabled in the config to the AST, in place,
+    in a single traversal. If `edits` is given, the changes made are
+    appended to it. With `config.prune_dead_sites`, sites outside the
+    output cone of influence are left alone (`cone`: the ConeOfInfluence
+    of the design, computed from the AST if not given).
+    """
+    composite = CompositePerturber.from_config(config)
+    if composite.perturbers:
+        if not config.prune_dead_sites:
+            cone = None
+        elif cone is None:
+            with recorder.span("prune"):
+                cone = ConeOfInfluence(ast)
+        names = ", ".join(perturber.name for perturber in composite.perturbers)
+        recorder.log(f"Applying {names} perturbation(s)...")
+        with recorder.span("perturb", strategies=names):
+            composite.apply(ast, cone)
+        if cone is not None:
+            recorder.log(f"Pruned {composite.pruned} site(s) outside the output cone of influence.")
+    if edits is not None:
+        edits.extend(composite.edits)
+    return ast
+
+def generate_verilog(ast, config: FaultInjConfig, source_text: str = None, edits: list = None) -> str:
+    """
+    Generate Verilog code for the perturbed AST.
+    With `config.incremental_codegen`, only the perturbed code is spliced
+    into `source_text`; if that text is not available or the edits cannot be
+    located in it, the whole design is regenerated.
+    """
+    codegenerator = get_codegenerator()
+    if config.incremental_codegen and source_text is not None and edits is not None:
+        with recorder.span("splice", edits=len(edits)):
+            spliced = splice_edits(source_text, ast, edits, codegenerator)
+        if spliced is not None:
+            return spliced
+        recorder.log("Incremental code generation not possible, regenerating the whole design...")
+    # Generate Verilog code from AST
+    with recorder.span("codegen"):
+        return codegenerator.visit(ast)
+
+def read_source(input_files: list[str], config: FaultInjConfig):
+    """
+    Return the source text to splice into, if incremental code generation
+    applies (a single input file).
+    """
+    if not config.incremental_codegen or len(input_files) != 1:
+        return None
+    with open(input_files[0], "r") as f:
+        return f.read()
+
+def fault_inject(input_files: list[str], config: FaultInjConfig, cache=None) -> str:
     """
     Main fault injection function.
     Parses the input Verilog file, applies perturbations based on the config,
     and writes the perturbed Verilog to the output file.
+    `cache` is an optional ParseCache (default: $FAULTINJ_CACHE_DIR).
     """
-    ast, _ = parse(input_files)
-    
-    # Apply perturbations based on config
-    if config.flip_assigns:
-        print("Applying assignment_flipping perturbation...")
-        flipper = AssignmentFlipper(config=config)
-        flipper.apply(ast)
-    if config.invert_logic:
-        print("Applying invert_logic perturbation...")
-        inverter = LogicInverter(config=config)
-        inverter.apply(ast)
-    if config.change_constants:
-        print("Applying change_constants perturbation...")
-        changer = ConstChanger(config=config)
-        changer.apply(ast)
-    if config.randomize_assignments:
-        print("Applying randomize_assignments perturbation...")
-        randomizer = AssignmentRandomizer(config=config)
-        randomizer.apply(ast)
-
-    codegenerator = ASTCodeGenerator()
-    # Generate Verilog code from AST
-    return codegenerator.visit(ast)
+    ast, _ = parse_verilog(input_files, cache=cache)
+    edits = []
+    apply_perturbations(ast, config, edits)
+    return generate_verilog(ast, config, read_source(input_files, config), edits)
+
+def fault_inject_many(input_files: list[str], configs_or_seeds: list, base_config: FaultInjConfig = None, cache=None) -> list[str]:
+    """
+    Batch fault injection.
+    Parses the input Verilog files once and produces one perturbed variant per
+    entry of `configs_or_seeds`. Entries are either a FaultInjConfig or an int
+    seed, which is applied on top of `base_config` (default config if None).
+    Every variant starts from a pickled snapshot of the pristine AST, so the
+    parse cost (and, with `prune_dead_sites`, the cone analysis) is paid
+    once for the whole batch.
+    """
+    if base_config is None:
+        base_config = FaultInjConfig()
+    ast, _ = parse_verilog(input_files, cache=cache)
+    snapshot = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
 
-def fault_inject_svm(input_file: str, output_dir: str) -> dict:
+    source_text = None
+    # the cones depend on the design only: computed once, for every variant
+    cone = None
+    variants = []
+    for entry in configs_or_seeds:
+        if isinstance(entry, FaultInjConfig):
+            config = entry
+        else:
+            config = base_config.model_copy(update={"seed": entry})
+        if source_text is None:
+            source_text = read_source(input_files, config)
+        if config.prune_dead_sites and cone is None:
+            with recorder.span("prune"):
+                cone = ConeOfInfluence(ast)
+        edits = []
+        variant = apply_perturbations(pickle.loads(snapshot), config, edits, cone)
+        variants.append(generate_verilog(variant, config, source_text, edits))
+    return variants
+
+def fault_inject_sites(input_files: list[str], config: FaultInjConfig, sites=None, sample: int = None, cache=None):
+    """
+    Single-fault injection.
+    Indexes every mutation site of the strategies enabled in the config and
+    yields (site, verilog) for one variant per site, each with only that site
+    perturbed. `sites` restricts the run to the given site indices, `sample`
+    to that many sites drawn at random; with `config.prune_dead_sites`, sites
+    outside the output cone of influence are left out (before sampling, so
+    a sample holds `sample` live sites whenever there are that many). One AST serves every
+    variant: a site is mutated in place and restored afterwards, and with
+    `config.incremental_codegen` only the edit is spliced into the source.
+    """
+    ast, _ = parse_verilog(input_files, cache=cache)
+    index = SiteIndex(ast, CompositePerturber.from_config(config).perturbers)
+    selected = [index[i] for i in sites] if sites is not None else list(index)
+    if config.prune_dead_sites:
+        # pruned first, so that a sample is drawn from the live sites only
+        cone = ConeOfInfluence(ast)
+        live = [site for site in selected if cone.is_live_site(index, site)]
+        recorder.count("sites.pruned", len(selected) - len(live))
+        recorder.log(f"Pruned {len(selected) - len(live)} site(s) outside the output cone of influence.")
+        selected = live
+    if sites is None and sample is not None:
+        selected = index.sample(sample, derive_rng(config.seed, "sample") if config.seed is not None else None,
+                                pool=selected)
+    recorder.count("sites.indexed", len(index))
+    recorder.log(f"Generating {len(selected)} of {len(index)} single-fault variant(s)...")
+
+    codegenerator = get_codegenerator()
+    source_text = read_source(input_files, config)
+    splicer = Splicer(source_text, ast) if source_text is not None else None
+    for site in selected:
+        with recorder.span("variant", site=site.index, kind=site.kind), index.mutated([site]) as edits:
+            verilog = splicer.splice(edits, codegenerator) if splicer is not None else None
+            if verilog is None:
+                verilog = codegenerator.visit(ast)
+        recorder.count(f"sites.mutated.{site.kind}")
+        yield site, verilog
+
+def fault_inject_combinations(input_files: list[str], config: FaultInjConfig, k: int = 2, sample: bool = False,
+                              limit: int = None, cache=None):
+    """
+    Higher-order (k-fault) injection.
+    Lazily yields (sites, verilog) for variants with exactly `k` mutation
+    sites perturbed together, over the sites of the strategies enabled in
+    the config (live sites only, with `config.prune_dead_sites`). The
+    combinations come in lexicographic order, or in random order (from the
+    config seed) with `sample`, and stop after `limit` variants. Neither the
+    combinations nor the variants are ever materialized: each variant is
+    generated from the one AST, whose sites are restored afterwards.
+    """
+    ast, _ = parse_verilog(input_files, cache=cache)
+    index = SiteIndex(ast, CompositePerturber.from_config(config).perturbers)
+    pool = list(index)
+    if config.prune_dead_sites:
+        cone = ConeOfInfluence(ast)
+        pool = [site for site in pool if cone.is_live_site(index, site)]
+        recorder.count("sites.pruned", len(index) - len(pool))
+        recorder.log(f"Pruned {len(index) - len(pool)} site(s) outside the output cone of influence.")
+    recorder.count("sites.indexed", len(index))
+    rng = None
+    if sample:
+        rng = derive_rng(config.seed, "combinations") if config.seed is not None else random.Random()
+    recorder.log(f"Generating {k}-fault variants over {len(pool)} site(s)...")
+
+    codegenerator = get_codegenerator()
+    source_text = read_source(input_files, config)
+    splicer = Splicer(source_text, ast) if source_text is not None else None
+    for sites in index.combinations(k, pool, rng=rng, limit=limit):
+        with recorder.span("variant", sites=[site.index for site in sites]), index.mutated(sites) as edits:
+            verilog = splicer.splice(edits, codegenerator) if splicer is not None else None
+            if verilog is None:
+                verilog = codegenerator.visit(ast)
+        recorder.count("variants.combined")
+        yield sites, verilog
+
+def fault_inject_svm(input_file: str, output_dir: str, jobs: int = 1, seed: int = None, prune: bool = False,
+                     pack: bool = False, large_file: bool = False, budget: int = None,
+                     quotas=None, engine: str = "regex") -> MutantTable:
     """
     Main fault injection function.
     Parses the input Verilog file, applies smartVerilog mutation testing,
     and writes the perturbed Verilog to the output directory.
+    Mutants are generated on `jobs` worker processes (None: one per core);
+    for a given `seed` they are the same for any number of workers.
+    With `prune`, mutants of signals outside the output cone are dropped.
+    With `pack`, the mutants are written into a single mutants.pack archive.
+    With `large_file`, the input is memory-mapped instead of read in.
+    With a `budget` and/or per-category `quotas`, only a sample of the
+    mutants is kept (deterministic for a given seed).
+    With `engine` "ast", operators are mutated on the parsed AST rather
+    than by the regex rules.
+    Returns the metadata of every mutant, keyed by mutation id.
     """
     # Run SmartVerilog mutation testing
-    print("Using SmartVerilog mutation module...")
-    mutation_tool = SmartVerilogMutation(input_file, output_dir)
+    recorder.log("Using SmartVerilog mutation module...")
+    mutation_tool = SmartVerilogMutation(input_file, output_dir, seed=seed, jobs=jobs, prune=prune, pack=pack,
+                                         large_file=large_file, budget=budget, quotas=quotas,
+                                         engine=engine)
     metadata = mutation_tool.run()
     return metadata
 
@@ -61,11 +228,20 @@ def main():
     Handles argument parsing, config loading, and (future) perturbation orchestration.
     """
     parser = argparse.ArgumentParser(description="Fault Injection Tool for Verilog")
-    parser.add_argument("--input", "-i", required=True, help="Input Verilog .v file")
+    parser.add_argument("--input", "-i", required=True, help="Input Verilog .v file, or a directory/glob/filelist (@list, .f) for batch mode")
     parser.add_argument("--output", "-o", required=False, help="Output perturbed Verilog .v file/directory")
     parser.add_argument("--config", "-c", required=True, help="Path to config JSON file")
     parser.add_argument("--seed", type=int, default=None, help="Random seed (overrides config)")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Worker processes: per design in batch mode (default: one per core), for SmartVerilog mutant generation otherwise (default: 1; 0: one per core)")
+    parser.add_argument("--batch", "-b", action="store_true", help="Treat --input as a filelist even without an @ prefix or .f suffix")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-design timeout in seconds (batch mode)")
+    parser.add_argument("--report", default=None, help="Batch summary report path (default: <output>/batch_report.json)")
+    parser.add_argument("--connect", nargs="?", const=DEFAULT_SOCKET, default=None, help="Send the job to a running fault injection server (python -m faultinj.server) at this socket")
+    parser.add_argument("--cache-dir", default=None, help="Cache preprocessed/parsed Verilog in this directory (default: $FAULTINJ_CACHE_DIR)")
+    parser.add_argument("--cache-size", type=float, default=None, help="Parse cache size limit in MB")
     parser.add_argument("--show-diff", "-s", action="store_true", help="Show diff between original and perturbed Verilog")
+    parser.add_argument("--trace", default=None, help="Record phase timings and counters to this file")
+    parser.add_argument("--trace-format", choices=["chrome", "json"], default="chrome", help="Trace file format (chrome: chrome://tracing / Perfetto)")
     args = parser.parse_args()
 
     # Load config
@@ -73,21 +249,76 @@ def main():
     if args.seed is not None:
         config.seed = args.seed
 
+    # exported so that batch workers pick up the same cache
+    if args.cache_dir is not None:
+        os.environ[CACHE_DIR_ENV] = args.cache_dir
+    if args.cache_size is not None:
+        os.environ[CACHE_SIZE_ENV] = str(args.cache_size)
+
     print("Loaded config:")
     print(config.model_dump_json(indent=2))
 
+    if args.trace:
+        recorder.enable()
+    try:
+        run(args, config)
+    finally:
+        if args.trace:
+            recorder.save(args.trace, args.trace_format)
+            print(f"Trace written to {args.trace}")
 
-    if not config.svm:
-        codegenerator = ASTCodeGenerator()
+def svm_jobs(args):
+    """
+    Worker processes for SmartVerilog mutant generation: 1 unless given,
+    0 meaning one per core (None).
+    """
+    return 1 if args.jobs is None else args.jobs or None
+
+def run(args, config: FaultInjConfig):
+    """
+    Run the injection requested on the command line.
+    """
+    if args.connect:
+        if args.output is None:
+            raise ValueError("Output file/directory must be specified when connecting to a server.")
+        job = {"input": args.input, "config": config.model_dump(), "output": args.output, "jobs": svm_jobs(args)}
+        response = submit(job, args.connect)
+        if response["status"] != "ok":
+            raise RuntimeError(f"Fault injection server failed: {response['error']}")
+        if config.svm:
+            print(f"{response['written']} mutated Verilog files written to {args.output} "
+                  f"({len(response['metadata'])} generated)")
+        else:
+            with open(args.output, "w") as f:
+                f.write(response["verilog"])
+            print(f"Perturbed Verilog written to {args.output}")
+    elif args.batch or is_batch_input(args.input):
+        if args.output is None:
+            raise ValueError("Output directory must be specified in batch mode.")
+        spec = args.input
+        if not is_batch_input(spec):
+            spec = "@" + spec  # --batch with a plain filelist
+        input_files = expand_inputs(spec)
+        report = run_batch(input_files, args.output, config, jobs=args.jobs or None,
+                           timeout=args.timeout, report_path=args.report)
+        print(f"Batch finished: {report['ok']} ok, {report['error']} error, {report['timeout']} timeout "
+              f"out of {report['total']} designs")
+    elif not config.svm:
+        codegenerator = get_codegenerator()
         original_verilog = None
         if args.show_diff:
-            ast, _ = parse([args.input])
-            original_verilog = codegenerator.visit(ast)
-
-        # Apply perturbations
-        perturbed_verilog = fault_inject([args.input], config)
+            # Parse once: emit the original, then perturb the same AST
+            ast, _ = parse_verilog([args.input])
+            source_text = read_source([args.input], config)
+            original_verilog = source_text if source_text is not None else codegenerator.visit(ast)
+            edits = []
+            apply_perturbations(ast, config, edits)
+            perturbed_verilog = generate_verilog(ast, config, source_text, edits)
+        else:
+            # Apply perturbations
+            perturbed_verilog = fault_inject([args.input], config)
 
-        with open(args.output, "w") as f:
+        with recorder.span("write", path=args.output), open(args.output, "w") as f:
             f.write(perturbed_verilog)
 
         if args.show_diff and original_verilog is not None:
@@ -109,8 +340,11 @@ def main():
         output_dir = args.output
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
-        num_muts = fault_inject_svm(args.input, output_dir)
-        print(f"{num_muts} mutated Verilog files written to {output_dir}")
+        metadata = fault_inject_svm(args.input, output_dir, jobs=svm_jobs(args), seed=config.seed,
+                                    prune=config.prune_dead_sites, pack=config.pack_mutants,
+                                    large_file=config.large_file, budget=config.mutant_budget,
+                                    quotas=config.category_quotas, engine=config.svm_engine)
+        print(f"{metadata.kept()} mutated Verilog files written to {output_dir} ({len(metadata)} generated)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,160 @@
+# instrument.py
+# Phase timing and counters.
+#
+# A process-wide Recorder collects spans (named, timed phases such as parse,
+# perturb, codegen, file writes and verification jobs) and counters (sites
+# visited and mutated, mutants per category, ...). Recording is off unless
+# enabled, e.g. through the --trace flag of inject.py, and can be exported as
+# plain JSON or in the Chrome trace event format (chrome://tracing, Perfetto).
+# Worker processes record into their own Recorder and send what they
+# recorded back with their results (`drain`), for the parent to `merge`.
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Recorder:
+    """
+    Collects spans and counters while enabled.
+    Progress messages go through `log`, which always prints them and, while
+    recording, also keeps them as instant events on the timeline.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = []
+        self.events = []
+        self.counters = {}
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self.events = []
+            self.counters = {}
+            self.origin = time.perf_counter()
+
+    def drain(self):
+        """
+        Return what has been recorded so far and start over, e.g. in a
+        worker process sending its recording back with each result.
+        Times stay relative to this process's origin, which is included.
+        """
+        with self._lock:
+            recording = {"origin": self.origin, "spans": self.spans,
+                         "events": self.events, "counters": self.counters}
+            self.spans = []
+            self.events = []
+            self.counters = {}
+        return recording
+
+    def merge(self, recording):
+        """
+        Add a recording returned by `drain` (in another process) to this
+        one, its times shifted onto this recorder's origin.
+        """
+        if not self.enabled or not recording:
+            return
+        # perf_counter is system-wide, so origins are comparable
+        shift = recording["origin"] - self.origin
+        with self._lock:
+            for span in recording["spans"]:
+                self.spans.append(dict(span, start=span["start"] + shift))
+            for event in recording["events"]:
+                self.events.append(dict(event, time=event["time"] + shift))
+            for name, n in recording["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def _now(self):
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Time the enclosed block as a span; `args` are attached to it and may
+        be updated inside the block through the yielded dict.
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = self._now()
+        try:
+            yield args
+        finally:
+            span = {
+                "name": name,
+                "start": start,
+                "duration": self._now() - start,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.spans.append(span)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def log(self, message):
+        print(message)
+        if self.enabled:
+            with self._lock:
+                self.events.append({"name": message, "time": self._now(),
+                                    "pid": os.getpid(), "tid": threading.get_ident()})
+
+    def to_json(self):
+        """
+        Return the recording as a plain dict (times in seconds).
+        """
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault(span["name"], {"count": 0, "total": 0.0})
+            total["count"] += 1
+            total["total"] += span["duration"]
+        return {
+            "spans": self.spans,
+            "events": self.events,
+            "counters": dict(self.counters),
+            "totals": totals,
+        }
+
+    def to_chrome_trace(self):
+        """
+        Return the recording in the Chrome trace event format.
+        """
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": span["name"], "ph": "X", "cat": span["name"].split(".")[0],
+                "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6,
+                "pid": span["pid"], "tid": span["tid"], "args": span["args"],
+            })
+        for event in self.events:
+            events.append({
+                "name": event["name"], "ph": "i", "s": "t",
+                "ts": event["time"] * 1e6, "pid": event["pid"], "tid": event["tid"],
+            })
+        end = self._now() * 1e6
+        for name, value in self.counters.items():
+            events.append({"name": name, "ph": "C", "ts": end, "pid": os.getpid(), "args": {"value": value}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path, format="chrome"):
+        """
+        Write the recording to `path` as "chrome" trace or plain "json".
+        """
+        data = self.to_chrome_trace() if format == "chrome" else self.to_json()
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1, default=str)
+
+
+recorder = Recorder()
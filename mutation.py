@@ -8,15 +8,24 @@
 
 import re
 import os
+import json
 import random
 import sys
-import subprocess
 import shutil
-import time
 import threading
-import uuid
+import hashlib
+from array import array
 from concurrent.futures import ProcessPoolExecutor
 
+from .store import MutantStore, MutantPack, MappedLines
+from .table import MutantTable
+from .scheduler import VerificationScheduler, write_assertion_file
+from .pipeline import CampaignPipeline
+from .screen import Screener
+from .instrument import recorder
+from .sampling import StratifiedSampler
+from .utils import derive_rng
+
 mutant_check_list = ["arb2","ibex_controller","ibex_decoder","ibex_id_stage","ibex_multdiv_slow"]
 
 verilog_keywords = [
@@ -61,16 +70,134 @@ verilog_keywords = [
     "generate", "endgenerate",
 ]
 
+ALWAYS_RE = re.compile(r"^\s*always\b")
+BEGIN_RE = re.compile(r"\bbegin\b")
+END_RE = re.compile(r"\bend\b")
+# an escape, a character class or an opening capturing group in a pattern
+PATTERN_TOKEN_RE = re.compile(r"\\.|\[\^?\]?(?:\\.|[^\]])*\]|\((?!\?)")
+
+
+def uncaptured(pattern):
+    """
+    Return `pattern` with its capturing groups made non-capturing.
+    """
+    return PATTERN_TOKEN_RE.sub(lambda m: "(?:" if m.group() == "(" else m.group(), pattern)
+WORD_RE = re.compile(r"\w+")
+
+def index_words(line):
+    """
+    Map every maximal word in the line to its (start, end) spans; a word's
+    spans are exactly the hits of `\\b<word>\\b` on that line.
+    """
+    spans = {}
+    for m in WORD_RE.finditer(line):
+        spans.setdefault(m.group(0), []).append(m.span())
+    return spans
+
+def splice_spans(line, edits):
+    """
+    Replace the non-overlapping (start, end, text) edits, given in order.
+    """
+    parts = []
+    pos = 0
+    for start, end, text in edits:
+        parts.append(line[pos:start])
+        parts.append(text)
+        pos = end
+    parts.append(line[pos:])
+    return "".join(parts)
+
+LINE_COMMENT_RE = re.compile(r"//.*$")
+BLOCK_COMMENT_RE = re.compile(r"/\*.*?\*/")
+SPACE_RE = re.compile(r"\s+")
+PUNCT_SPACE_RE = re.compile(r" ?([()\[\]{};,]) ?")
+
+def normalize_line(line):
+    """
+    Strip comments and insignificant whitespace from a source line, so that
+    lines differing only in layout compare equal.
+    """
+    line = BLOCK_COMMENT_RE.sub(" ", line)
+    line = LINE_COMMENT_RE.sub("", line)
+    line = SPACE_RE.sub(" ", line).strip()
+    return PUNCT_SPACE_RE.sub(r"\1", line)
+
+def mutant_digest(line_no, line):
+    """
+    Content address of a mutant: every mutant differs from the source in one
+    line only, so the line number and the normalized mutated line identify it.
+    """
+    return hashlib.sha256(f"{line_no}:{normalize_line(line)}".encode()).hexdigest()[:16]
+
+def findall_value(match):
+    """
+    Render a match the way re.findall would: whole match, sole group, or group tuple.
+    """
+    if match.re.groups == 0:
+        return match.group(0)
+    if match.re.groups == 1:
+        return match.group(1)
+    return match.groups()
+
 class SmartVerilogMutation:
-    def __init__(self, input_file, output_dir):
+    def __init__(self, input_file, output_dir, write_mutants=True, seed=None, jobs=1, screen=True, screen_parse=False, prune=False, pack=False, large_file=False,
+                 budget=None, quotas=None, engine="regex", keep_records=True):
         self.input_file = input_file
         self.output_dir = output_dir
+        # when False, only the patch store (base file + index) is written
+        self.write_mutants = write_mutants
+        # when True, all mutants go into one archive (mutants.pack) instead
+        # of a file each
+        self.pack = pack
+        # when True, the input is memory-mapped rather than read into memory
+        # and mutants are written with range copies from it (huge netlists)
+        self.large_file = large_file
+        # every line draws from its own stream derived from the seed, so the
+        # mutants do not depend on how the lines are sharded across workers
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.rng = derive_rng(self.seed, "rules")
+        # number of worker processes (None: one per core)
+        self.jobs = jobs
+        self.store = None
+        # metadata of every mutant generated (see table.py)
+        self.table = None
+        # when False, the records only go to the consumers of iter_mutants
+        # (and its sink): no table is saved, the verdicts below are not
+        # collected and, with mutant files, no patch is kept once written
+        self.keep_records = keep_records
+        # number of mutants stored (and written)
+        self.kept = 0
+        # mutant id -> id of the identical mutant kept in its place
+        # (0: equivalent to the unmutated source)
+        self.duplicates = {}
+        # mutants failing the syntax pre-screen (see screen.py) are only
+        # recorded, with their reason code, and never written or verified
+        self.screen = screen
+        self.screen_parse = screen_parse
+        self.screener = None
+        self.rejected = {}
+        # mutants of lines assigning signals outside the output cone of
+        # influence (see prune.py) are recorded with "live": False only
+        self.prune = prune
+        self.pruned = set()
+        # with a budget (a total count and/or per-category quotas), only a
+        # sample of the mutants is kept, chosen with StratifiedSampler
+        self.budget = budget
+        self.quotas = quotas
+        # "regex": operators are mutated by the bitwise/arithmatic/relational
+        # rules; "ast": by OperatorMutator on the parsed design instead
+        if engine not in ("regex", "ast"):
+            raise ValueError(f"Unknown SmartVerilog engine '{engine}'.")
+        self.engine = engine
         self.code_lines = []
         self.mutations = []
         self.unmatched_rules = []
         self.always_block = False 
 
     def load_verilog(self):
+        if self.large_file:
+            self.code_lines = MappedLines(self.input_file)
+            return
         with open(self.input_file, 'r') as file:
             self.code_lines = file.readlines()
 
@@ -87,12 +214,13 @@ class SmartVerilogMutation:
         bit_range = match.group("range")
         bit_width = int(bit_range.split(":")[0][1:]) - int(bit_range.split(":")[1][:-1]) + 1
         max_value = (1 << bit_width) - 1
-        mutated_value = random.choice([v for v in range(0, max_value + 1) if v != current_value])
+        mutated_value = self.rng.choice([v for v in range(0, max_value + 1) if v != current_value])
         return f"localparam {match.group('range')} {match.group('variable')} = {mutated_value};"
 
     def define_mutations(self):    
         # define muation operations
         self.mutations = []
+        self.rng = derive_rng(self.seed, "rules")
     
         # operation sets
         self.bitwise_ops = {"&": r"\&", "|": r"\|", "^": r"\^"}
@@ -103,14 +231,14 @@ class SmartVerilogMutation:
         self.gate_ops = {"and", "or", "nand", "nor", "xor", "xnor"}
         self.small_gate_ops = {"not", "buf","dff"}
         # gate mutation
-        for op in self.gate_ops:
+        for op in sorted(self.gate_ops):
             self.mutations.append({
                 "category": "gate",
                 "pattern": rf"\b{op}\b",
-                "replacement": random.choice([y for y in self.gate_ops if y != op])
+                "replacement": self.rng.choice(sorted(y for y in self.gate_ops if y != op))
             })
         
-        for op in self.small_gate_ops:
+        for op in sorted(self.small_gate_ops):
             self.mutations.append({
                 "category": "small_gate",
                 "pattern": rf"\b{op}\b",
@@ -122,7 +250,7 @@ class SmartVerilogMutation:
             self.mutations.append({
                 "category": "bitwise",
                 "pattern": escaped_op,
-                "replacement": random.choice([y for y in self.bitwise_ops.keys() if y != op])
+                "replacement": self.rng.choice([y for y in self.bitwise_ops.keys() if y != op])
             })
         
         # arithmatic mutation
@@ -130,7 +258,7 @@ class SmartVerilogMutation:
             self.mutations.append({
                 "category": "arithmatic",
                 "pattern": escaped_op,
-                "replacement": random.choice([y for y in self.arithmatic_ops.keys() if y != op])
+                "replacement": self.rng.choice([y for y in self.arithmatic_ops.keys() if y != op])
             })
         
         # relational mutation
@@ -138,14 +266,14 @@ class SmartVerilogMutation:
             self.mutations.append({
                 "category": "relational",
                 "pattern": escaped_op,
-                "replacement": random.choice([y for y in self.relational_ops.keys() if y != op])
+                "replacement": self.rng.choice([y for y in self.relational_ops.keys() if y != op])
             })
 
         # variable_negation mutation
         self.mutations.append({
             "category": "variable_negation",
             "pattern": r"(?<![!~\d0-9'])\b[a-zA-Z_]\w*\b", 
-            "replacement": lambda m: random.choice([f"!{m.group(0)}", f"~{m.group(0)}"])
+            "replacement": lambda m: self.rng.choice([f"!{m.group(0)}", f"~{m.group(0)}"])
         })
 
         # localparam mutation
@@ -166,7 +294,7 @@ class SmartVerilogMutation:
         self.mutations.append({
             "category": "verilog_random_literal",
             "pattern": r"(\d+)'([bBoOdDhH])[01]+",
-            "replacement": lambda m: f"{m.group(1)}'{m.group(2)}{''.join(random.choice(['0', '1']) for _ in range(int(m.group(1))))}"
+            "replacement": lambda m: f"{m.group(1)}'{m.group(2)}{''.join(self.rng.choice(['0', '1']) for _ in range(int(m.group(1))))}"
         })
 
         # Logical mutation for changing input to output
@@ -183,6 +311,12 @@ class SmartVerilogMutation:
             "replacement": lambda m: f"input wire {m.group(1)};"
         })
 
+        if self.engine == "ast":
+            # operators are mutated on the AST instead (see operator_mutants);
+            # the rules are only dropped now, so the others draw the same choices
+            from .perturbations import OPERATOR_GROUPS
+            self.mutations = [m for m in self.mutations if m["category"] not in OPERATOR_GROUPS]
+
         # Below is unmatch rule
         self.unmatched_rules.append("always")
         self.unmatched_rules.append("//")
@@ -192,225 +326,506 @@ class SmartVerilogMutation:
         self.unmatched_rules.append("localparam")
         self.unmatched_rules.append("parameter")
         self.unmatched_rules.append("wire")
-        print(f"Generated {len(self.mutations)} mutation rules.")
+        self.compile_mutations()
+        recorder.log(f"Generated {len(self.mutations)} mutation rules.")
+
+    def compile_mutations(self):
+        """
+        Precompile the rule patterns once so that matching a line never
+        rebuilds a regex, and fold them into the scanners of match_line:
+        one with every rule (lines of always blocks), one without
+        variable_negation (other lines).
+        """
+        for mutation in self.mutations:
+            mutation["regex"] = re.compile(mutation["pattern"])
+        rules = list(enumerate(self.mutations))
+        self.scanners = {
+            True: self._scanner(rules),
+            False: self._scanner([(i, m) for i, m in rules if m["category"] != "variable_negation"]),
+        }
+        self.unmatched_regex = re.compile("|".join(re.escape(rule) for rule in self.unmatched_rules))
+
+    @staticmethod
+    def _scanner(rules):
+        """
+        Compile the (index, mutation) rules into one regex that stops only
+        where some rule matches, its group k (the rules' own groups made
+        non-capturing) spanning the match of the k-th rule there, if any.
+        Returns (regex, rule indices), or None without rules.
+        """
+        if not rules:
+            return None
+        patterns = [uncaptured(mutation["pattern"]) for _, mutation in rules]
+        # the gate tries variable_negation, the rule hitting most often,
+        # first; no rule matches from a whitespace character
+        gate = sorted(zip(patterns, rules), key=lambda rule: rule[1][1]["category"] != "variable_negation")
+        any_rule = "|".join(f"(?:{pattern})" for pattern, _ in gate)
+        groups = "".join(f"(?:(?=({pattern}))|)" for pattern in patterns)
+        regex = re.compile(f"(?=\\S)(?=(?:{any_rule})){groups}")
+        if regex.groups != len(rules):
+            raise ValueError("Cannot fold the mutation rules into one scanner.")
+        return regex, [i for i, _ in rules]
+
+    def match_line(self, line, in_always_block):
+        """
+        Collect every (mutation, matches) hit on a line in rule order.
+        The line is scanned once for the hits of every rule; each rule keeps
+        its hits that do not overlap an earlier one (as its own finditer
+        would), re-matched in place so the match objects carry the rule's
+        groups, for the metadata and for building the mutated line.
+        """
+        scanner = self.scanners[bool(in_always_block)]
+        if scanner is None:
+            return []
+        scanner, rules = scanner
+        # rule index -> starts of its hits, and the end of its last one
+        found = {}
+        ends = {}
+        for hit in scanner.finditer(line):
+            matched = hit.groups()
+            if len(rules) - matched.count(None) == 1:
+                # the common case: a single rule matches here
+                groups = (hit.lastindex,)
+            else:
+                groups = [k for k, text in enumerate(matched, 1) if text is not None]
+            for group in groups:
+                i = rules[group - 1]
+                start, end = hit.span(group)
+                if start < ends.get(i, 0):
+                    continue
+                ends[i] = end if end > start else start + 1
+                found.setdefault(i, []).append(start)
+        hits = []
+        for i in sorted(found):
+            mutation = self.mutations[i]
+            hits.append((mutation, [mutation["regex"].match(line, start) for start in found[i]]))
+        return hits
 
     def is_in_always_block(self, line):
-        if re.search(r"^\s*always\b", line):
+        if ALWAYS_RE.search(line):
             self.always_block = True
             self.begin_count = 1 
             return
 
         if self.always_block:
-            if re.search(r"\bbegin\b", line):  
+            if BEGIN_RE.search(line):  
                 self.begin_count += 1
-            if re.search(r"\bend\b", line):    
+            if END_RE.search(line):    
                 self.begin_count -= 1
             
             if self.begin_count == 0:
                 self.always_block = False
 
-    def write_to_file(self, mutation_count,line,modified_line,comment=""):
+    def write_to_file(self, mutation_count, comment=""):
         file_dir = self.output_dir+"/mutant_"+str(mutation_count)+".sv"
-        with open(file_dir, 'w') as file:
-            file.write(comment)
-            for self_line in self.code_lines:
-                if self_line == line:
-                    file.write(modified_line)
+        with recorder.span("write_mutant", mutant=mutation_count):
+            self.store.write(mutation_count, file_dir, comment)
+
+    def line_states(self):
+        """
+        Serial pre-pass over the source: return (line_nos, in_always_blocks),
+        the number of every line the rules may touch and whether it is in an
+        always block. This is the only state carried from one line to the
+        next, so the lines can then be mutated in any order or process.
+        Only the numbers are kept: each line is read again from `code_lines`
+        when it is mutated (and, with `large_file`, only decoded then).
+        """
+        self.always_block = False
+        line_nos = array("I")
+        in_always_blocks = bytearray()
+        for line_no, line in enumerate(self.code_lines):
+            self.is_in_always_block(line)  # update always block status
+            if self.unmatched_regex.search(line):
+                continue
+            line_nos.append(line_no)
+            in_always_blocks.append(self.always_block)
+        return line_nos, in_always_blocks
+
+    def mutate_line(self, line_no, in_always_block, line=None):
+        """
+        Return the (category, match, mutated_line) mutants of a single line,
+        in rule order. The line is read from `code_lines` unless given.
+        """
+        if line is None:
+            line = self.code_lines[line_no]
+        # the line's own RNG stream makes the result independent of sharding
+        self.rng = derive_rng(self.seed, "line", line_no)
+        mutants = []
+        word_spans = None
+        for mutation, matches in self.match_line(line, in_always_block):
+            if(mutation["category"]=="variable_negation"):
+                if word_spans is None:
+                    word_spans = index_words(line)
+                for match in matches:
+                    # negate every whole-word occurrence of the variable
+                    replacement = mutation["replacement"](match)
+                    spans = word_spans[match.group(0)]
+                    modified_line = splice_spans(line, [(start, end, replacement) for start, end in spans])
+                    mutants.append((mutation["category"], [match.group(0)], modified_line))
+            else:
+                replacement = mutation["replacement"]
+                if callable(replacement):
+                    edits = [(m.start(), m.end(), replacement(m)) for m in matches]
                 else:
-                    file.write(self_line)
+                    edits = [(m.start(), m.end(), replacement) for m in matches]
+                modified_line = splice_spans(line, edits)
+                mutants.append((mutation["category"], [findall_value(m) for m in matches], modified_line))
+        return mutants
+
+    def screen_mutants(self, line_no, line, mutants):
+        """
+        Append the pre-screen verdict (None or a reason code) to each
+        (category, match, mutated_line) mutant of a line.
+        """
+        if not self.screen:
+            return [mutant + (None,) for mutant in mutants]
+        if self.screener is None:
+            self.screener = Screener(self.code_lines, parse=self.screen_parse)
+        return [mutant + (self.screener.check(line_no, line, mutant[2]),) for mutant in mutants]
+
+    def operator_mutants(self):
+        """
+        AST engine: return the operator mutants of the design by line, as
+        {line_no: [(category, match, mutated_line)]}. Every OperatorMutator
+        site is mutated alone and its new token spliced into its line; sites
+        that cannot be spliced that way are left out.
+        """
+        # pyverilog is only needed by the AST engine
+        from .frontend import parse_verilog, get_codegenerator
+        from .config import FaultInjConfig
+        from .perturbations import OperatorMutator, OPERATOR_CATEGORIES, SiteIndex
+        from .splice import Splicer, OPERATOR_SYMBOLS
+
+        with recorder.span("operator_sites") as span:
+            ast, _ = parse_verilog([self.input_file])
+            if isinstance(self.code_lines, MappedLines):
+                source_text = self.code_lines.data.decode()
+            else:
+                source_text = "".join(self.code_lines)
+            index = SiteIndex(ast, [OperatorMutator(FaultInjConfig(seed=self.seed, mutate_operators=True))])
+            splicer = Splicer(source_text, ast)
+            codegenerator = get_codegenerator()
+            mutants = {}
+            skipped = 0
+            for site in index:
+                with index.mutated([site]) as edits:
+                    regions = splicer.regions(edits, codegenerator)
+                    original = edits[0].original
+                line_span = splicer.source.line_span(site.lineno)
+                if not regions or line_span is None or regions[0][1] > line_span[1]:
+                    skipped += 1
+                    continue
+                start, end, text = regions[0]
+                line_no = site.lineno - 1
+                line = self.code_lines[line_no]
+                offset = line_span[0]
+                mutated_line = line[:start - offset] + text + line[end - offset:]
+                mutants.setdefault(line_no, []).append(
+                    (OPERATOR_CATEGORIES[original], [OPERATOR_SYMBOLS[original]], mutated_line))
+            span["sites"] = len(index)
+        recorder.count("sites.unspliced", skipped)
+        if skipped:
+            recorder.log(f"Skipped {skipped} of {len(index)} operator site(s) that cannot be mutated in their own line.")
+        return mutants
+
+    def mutate_lines(self):
+        """
+        Yield (line_no, line, mutants) for every candidate line in source order,
+        sharding the lines across a process pool when more than one job is
+        requested. Each mutant is (category, match, mutated_line, reason), the
+        workers also running the pre-screen. With the AST engine, the
+        operator mutants of a line follow those of the rules, including on
+        the lines the rules skip (comments, declarations, `always`, ...).
+        """
+        line_nos, in_always_blocks = self.line_states()
+        operators = self.operator_mutants() if self.engine == "ast" else {}
+        # lines with operator sites only, yielded in their place
+        operator_lines = sorted(set(operators).difference(line_nos), reverse=True)
+
+        def operator_lines_before(line_no):
+            while operator_lines and operator_lines[-1] < line_no:
+                other = operator_lines.pop()
+                line = self.code_lines[other]
+                yield other, line, self.screen_mutants(other, line, operators[other])
+
+        jobs = self.jobs if self.jobs is not None else os.cpu_count()
+        if jobs <= 1 or len(line_nos) < 2:
+            for line_no, in_always_block in zip(line_nos, in_always_blocks):
+                yield from operator_lines_before(line_no)
+                line = self.code_lines[line_no]
+                mutants = self.mutate_line(line_no, in_always_block, line) + operators.get(line_no, [])
+                yield line_no, line, self.screen_mutants(line_no, line, mutants)
+            yield from operator_lines_before(len(self.code_lines))
+            return
 
-    def generate_mutants(self):
+        # a few shards per worker keeps the pool busy when lines are uneven;
+        # a shard is a range of line numbers, the workers reading the lines
+        num_shards = min(len(line_nos), jobs * 4)
+        shard_size = -(-len(line_nos) // num_shards)
+        shards = [(line_nos[i:i + shard_size], in_always_blocks[i:i + shard_size])
+                  for i in range(0, len(line_nos), shard_size)]
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_shard_worker,
+                                 initargs=(self.input_file, self.seed, self.screen, self.screen_parse,
+                                           self.large_file, self.engine, recorder.enabled)) as executor:
+            # map yields the shards back in submission (= source) order
+            for (shard_lines, _), (results, recording) in zip(shards, executor.map(_mutate_shard, shards)):
+                recorder.merge(recording)
+                for line_no, mutants in zip(shard_lines, results):
+                    yield from operator_lines_before(line_no)
+                    line = self.code_lines[line_no]
+                    yield line_no, line, mutants + self.screen_mutants(line_no, line, operators.get(line_no, []))
+        yield from operator_lines_before(len(self.code_lines))
+
+    def iter_mutants(self, metadata_path=None):
+        """
+        Yield the metadata record of each mutant as soon as it is generated
+        (and, unless write_mutants is False or pack is True, written to disk).
+        If `metadata_path` is given, every record is also appended to that
+        file as one JSON line, so no consumer needs to hold all of them.
+        Mutants are identified by the digest of their normalized text: a
+        mutant identical to an earlier one (or to the source itself) keeps
+        its id and record, with `duplicate_of` naming the mutant kept, but is
+        neither stored nor written; the same holds for a mutant rejected by
+        the pre-screen, whose record carries the reason code in `screen`,
+        and, with pruning, for a mutant of a dead line (`live` False).
+        All records are also collected in `self.table`, which is saved to
+        the output directory once generation is done, unless keep_records
+        is False: memory then stays flat with mutant files, and only grows
+        by a patch per mutant kept with `pack` or without write_mutants
+        (and, with a budget, by a table row per candidate).
+        With a budget, the mutants that would be written are sampled instead
+        (see sampling.py), and their records carry `sampled` (None for the
+        mutants dropped before sampling and without a budget). The sample is
+        only known at the end of the pass: the other records still stream as
+        generated, and the candidates then follow in id order, the sampled
+        ones stored and written.
+        """
+        if not self.code_lines:
+            self.load_verilog()
+        if not self.mutations:
+            with recorder.span("define_mutations"):
+                self.define_mutations()
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
         # we should loop over each line
         # loop over each mutation rule
         # if a line and a rule match, apply the mutation, make a new file
+        # ids are assigned here, in source order, so they are the same for
+        # the serial and the parallel run
 
-        self.always_block = False 
-        
         test_count = 0
+        self.kept = 0
+        self.store = MutantStore(self.code_lines)
+        # without keep_records, only a budget's candidates get a row, to be
+        # reported once the sample is known
+        self.table = MutantTable(self.code_lines)
+        self.duplicates = {}
+        self.rejected = {}
+        self.pruned = set()
+        cone = None
+        if self.prune:
+            # pyverilog is only needed for the dataflow analysis
+            from .frontend import parse_verilog
+            from .prune import ConeOfInfluence
+            cone = ConeOfInfluence(parse_verilog([self.input_file])[0])
+        sampler = None
+        if self.budget is not None or self.quotas is not None:
+            sampler = StratifiedSampler(self.seed, self.budget, self.quotas)
+            if isinstance(self.quotas, dict):
+                categories = {mutation["category"] for mutation in self.mutations}
+                if self.engine == "ast":
+                    from .perturbations import OPERATOR_GROUPS
+                    categories.update(OPERATOR_GROUPS)
+                for category in set(self.quotas) - categories:
+                    recorder.log(f"Warning: quota for unknown mutation category '{category}'.")
+        sink = open(metadata_path, "w") if metadata_path is not None else None
 
-        metadata = {}
-
-        for line in self.code_lines:
-            mutated_lines = []
-            self.is_in_always_block(line)  # update always block status
-            unmatch_flag = False
-            for rule in self.unmatched_rules:
-                if rule in line:
-                    unmatch_flag = True
-                    break
-            if unmatch_flag:
-                continue
-
-            for mutation in self.mutations:
-                if(mutation["category"]=="variable_negation"):
-                    if not self.always_block:
-                        # print("Not in always block")
+        try:
+            for line_no, line, mutants in self.mutate_lines():
+                # digests are per line, so only this line's mutants can collide
+                seen = {mutant_digest(line_no, line): 0}
+                live = cone.is_live_line(line_no, line) if cone is not None else None
+                for category, match, modified_line, reason in mutants:
+                    test_count += 1
+                    recorder.count(f"mutants.{category}")
+                    comment = ""
+                    digest = mutant_digest(line_no, modified_line)
+                    meta_info = {
+                        "mutation_id": test_count,
+                        "category": category,
+                        "line": line_no + 1,
+                        "match": match,
+                        "original_line": line.strip(),
+                        "mutated_line": modified_line.strip(),
+                        "digest": digest,
+                        "duplicate_of": seen.get(digest),
+                        "screen": reason,
+                        "live": live,
+                        "sampled": None
+                    }
+                    if digest in seen:
+                        if self.keep_records:
+                            self.duplicates[test_count] = seen[digest]
+                        recorder.count("mutants.duplicate")
+                    elif reason is not None:
+                        seen[digest] = test_count
+                        if self.keep_records:
+                            self.rejected[test_count] = reason
+                        recorder.count(f"mutants.rejected.{reason}")
+                    elif live is False:
+                        seen[digest] = test_count
+                        if self.keep_records:
+                            self.pruned.add(test_count)
+                        recorder.count("mutants.pruned")
+                    elif sampler is not None:
+                        seen[digest] = test_count
+                        meta_info["sampled"] = False
+                        sampler.offer(category, test_count, (line_no, line, modified_line, meta_info))
+                        # its row now, as table ids must increase; emitted
+                        # once the sample is known
+                        self.table.add(meta_info)
                         continue
-                    matches = re.findall(mutation["pattern"], line)
-                    for match_index, match in enumerate(matches):
-                        modified_line = re.sub(
-                            rf"\b{re.escape(match)}\b", 
-                            mutation["replacement"](re.match(rf"\b{re.escape(match)}\b", match)), 
-                            line
-                        )
-                        test_count += 1
-                        # print(f"This is mutation {test_count}")
-                        # print(f"The match is: {match}")
-                        # print(f"The pattern is: {mutation['category']}")
-                        # print(f"Mutations: {line.strip()} -> {modified_line.strip()}")
-                        comment = ""
-                        meta_info = {
-                            "mutation_id": test_count,
-                            "category": mutation["category"],
-                            "match": [match],
-                            "original_line": line.strip(),
-                            "mutated_line": modified_line.strip()
-                        }
-                        metadata[test_count] = meta_info
-                        self.write_to_file(test_count, line, modified_line, comment)
-                else:   
-                    if len(re.findall(mutation["pattern"], line))>0:
-                        modified_line = re.sub(mutation["pattern"], mutation["replacement"], line)
-                        test_count += 1
-                        
-                        my_matchs = re.findall(mutation["pattern"], line)
-                        # print("This is the "+str(test_count)+" mutation")
-                        # print("The match is : "+str(my_matchs))
-                        # print("The pattern is: "+mutation["category"])
-                        # print("Muations: "+line + " -> " + modified_line)
-                        # then we should write the modified line to the file
-                        comment = ""
-                        meta_info = {
-                            "mutation_id": test_count,
-                            "category": mutation["category"],
-                            "match": my_matchs,
-                            "original_line": line.strip(),
-                            "mutated_line": modified_line.strip()
-                        }
-                        metadata[test_count] = meta_info
-                        self.write_to_file(test_count, line, modified_line, comment)
-        
-        return metadata
+                    else:
+                        seen[digest] = test_count
+                        self.keep(test_count, line_no, line, modified_line, comment)
+                    self.record(meta_info, sink)
+                    yield meta_info
+
+            if sampler is not None:
+                sample = dict(sampler.sample())
+                recorder.count("mutants.sampled", len(sample))
+                recorder.log(f"Sampled {len(sample)} of {sum(sampler.offered.values())} mutants.")
+                sampled = self.table.columns["sampled"]
+                for row, mutation_id in enumerate(self.table):
+                    if sampled[row] < 0:
+                        continue
+                    if mutation_id in sample:
+                        line_no, line, modified_line, meta_info = sample[mutation_id]
+                        meta_info["sampled"] = True
+                        sampled[row] = 1
+                        self.keep(mutation_id, line_no, line, modified_line)
+                    else:
+                        meta_info = self.table.record(row)
+                    if sink is not None:
+                        sink.write(json.dumps(meta_info) + "\n")
+                        sink.flush()
+                    yield meta_info
+        finally:
+            if sink is not None:
+                sink.close()
+            self.save_outputs()
+
+    def keep(self, mutation_id, line_no, line, modified_line, comment=""):
+        """
+        Store a mutant and, unless write_mutants is False or pack is True,
+        write it out (its patch is then dropped without keep_records).
+        """
+        self.kept += 1
+        self.store.add(mutation_id, line_no, line, modified_line)
+        if self.write_mutants and not self.pack:
+            self.write_to_file(mutation_id, comment)
+            if not self.keep_records:
+                self.store.discard(mutation_id)
+
+    def save_outputs(self):
+        """
+        Save the table (with keep_records) and, unless the mutants are
+        written as files, the store (as a pack with `pack`) to the output
+        directory.
+        """
+        if self.keep_records:
+            with recorder.span("write_table", mutants=len(self.table)):
+                self.table.save(self.output_dir)
+        if self.pack:
+            with recorder.span("write_pack", mutants=len(self.store)):
+                self.store.save_pack(self.output_dir)
+        elif not self.write_mutants:
+            with recorder.span("write_store", mutants=len(self.store)):
+                self.store.save(self.output_dir)
+
+    def record(self, meta_info, sink=None):
+        """
+        Add a metadata record to the table (with keep_records) and to the
+        JSON-lines sink.
+        """
+        if self.keep_records:
+            self.table.add(meta_info)
+        if sink is not None:
+            sink.write(json.dumps(meta_info) + "\n")
+            sink.flush()
+
+    def generate_mutants(self):
+        """
+        Generate every mutant and return their metadata as a MutantTable,
+        a read-only mapping from mutation id to record.
+        """
+        with recorder.span("generate_mutants") as span:
+            for _ in self.iter_mutants():
+                pass
+            span["mutants"] = len(self.table)
+        return self.table
         
     def run(self):
         self.load_verilog()
-        self.define_mutations()
+        with recorder.span("define_mutations"):
+            self.define_mutations()
         # print("Generating mutants...")
         # for muation in self.mutations:
         #     print(muation)
         return self.generate_mutants()
 
-def write_assertion_file(input_file, output_file, assertions):
-    try:
-        with open(input_file, "r") as file:
-            content = file.readlines()
-        
-        module_start_found = False
-        module_end_found = False
-        modified_content = []
-
-        module_start_pattern = re.compile(r"^\s*module\s+\w+")
-        semicolon_pattern = re.compile(r";")
-
-        for i, line in enumerate(content):
-            # Check if the module declaration has been found
-            if not module_start_found and module_start_pattern.match(line):
-                module_start_found = True
-                modified_content.append(line)
-                continue
-            
-            if module_start_found and not module_end_found:
-                modified_content.append(line)
-                if semicolon_pattern.search(line):  
-                    module_end_found = True
-                    for assertion in assertions:
-                        modified_content.append(f"    assert property ({assertion});\n")
-                continue
-            
-
-            modified_content.append(line)
-
-        if not module_start_found:
-            print(f"Warning: {input_file} does not contain a module declaration.")
-        elif not module_end_found:
-            print(f"Warining: {input_file} does not contain a module end declaration.")
-
-        with open(output_file, "w") as file:
-            file.writelines(modified_content)
-
-        # print(f"Assertions sucess {output_file}")
-
-    except FileNotFoundError:
-        print(f"Erorr: File '{input_file}' not found.")
-    except IOError as e:
-        print(f"Erorr: {e}")
-
-def run_fm_on_verilog_file(verilog_file,properties,verilog_related_files):
-    time_start = time.time()
-    unique_id = uuid.uuid4() 
-    sby_file = os.path.join(os.getcwd(), f"dis_{unique_id}.sby")
-    sby_result = os.path.join(os.getcwd(), f"dis_{unique_id}_task")
-
-    try:
-        
-    
-        dir_name = os.path.dirname(verilog_file)         
-        
-        file_base, file_ext = os.path.splitext(os.path.basename(verilog_file))
-
-        new_file_name = f"{file_base}_assertion{file_ext}"
-
-        new_file_path = os.path.join(dir_name, new_file_name)
-
-        write_assertion_file(verilog_file,new_file_path,properties)
-
-        return_result = []
-
-        try:
-            # cmd = [sby_path,"-f",sby_file,"task"]
-            
-            cmd = ["timeout","30","ebmc",new_file_path,"--bound","10","--top",top_module]
-
-            # cmd2 = ["ebmc",new_file_path,"--bound","10","--top",top_module]
+_shard_tool = None
 
-            result = subprocess.run(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True)
-            
-            # result2 = subprocess.run(cmd2,stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True)
-            # print("the return code is: ",result.returncode)                     
-            if(result.returncode != 0):
-                if(result.returncode ==124):
-                    return_result.append({verilog_file:"timeout"})
-                else:
-                    return_result.append({verilog_file:"error"})
-            else:
-                return_result.append({verilog_file:"verified"})
+def _init_shard_worker(input_file, seed, screen, screen_parse, large_file, engine, trace=False):
+    """
+    Build the mutation rules once per worker process; with `trace`, each
+    shard's results carry what was recorded while mutating it.
+    """
+    global _shard_tool
+    recorder.reset()
+    recorder.enabled = trace
+    _shard_tool = SmartVerilogMutation(input_file, None, seed=seed, screen=screen, screen_parse=screen_parse,
+                                       large_file=large_file, engine=engine)
+    _shard_tool.load_verilog()
+    _shard_tool.define_mutations()
+
+def _mutate_shard(shard):
+    line_nos, in_always_blocks = shard
+    code_lines = _shard_tool.code_lines
+    with recorder.span("mutate_shard", lines=len(line_nos)):
+        results = []
+        for line_no, in_always_block in zip(line_nos, in_always_blocks):
+            line = code_lines[line_no]
+            results.append(_shard_tool.screen_mutants(line_no, line,
+                                                      _shard_tool.mutate_line(line_no, in_always_block, line)))
+    return results, recorder.drain() if recorder.enabled else None
+
+def run_fm_on_verilog_file(verilog_file, properties, top_module, timeout=30, bound=10):
+    """
+    Run ebmc on a single Verilog file; see VerificationScheduler.
+    """
+    scheduler = VerificationScheduler(top_module, properties, timeout=timeout, bound=bound)
+    entry = scheduler.run_one(verilog_file)
+    return [{verilog_file: entry["status"]}]
 
-        except Exception as e:
-            print(f"Failed to create .sby file: {e}")
-            return_result.append({verilog_file:"error"})
-
-    except Exception as e:
-        print(f"Failed to run sby on {verilog_file}: {e}")
-        return_result.append({verilog_file:"error"})
-    subprocess.run(["rm","-rf",sby_file])
-    subprocess.run(["rm","-rf",sby_result])
-    time_end = time.time()
-    # print("Finish mutate time: "+str(time_end-time_start)+" on the file: "+verilog_file)
-    return return_result
-
-def run_fm_on_verilog_files(directory, properties, sby_path="sby"):
+def run_fm_on_verilog_files(directory, properties, top_module, jobs=None, timeout=30, bound=10, journal_path=None):
     """
-    Automatically runs `sby` on all Verilog files named mutant_*.sv in the specified directory.
+    Automatically runs `ebmc` on all Verilog files named mutant_*.sv in the specified directory.
+    If the directory holds a mutant pack (mutants.pack), the mutants are read
+    from the pack instead, and the names returned are those of the mutants.
 
     Parameters:
         directory (str): Path to the directory containing Verilog files.
-        sby_path (str): Path to the `sby` executable (default: "sby").
+        properties (list): Properties asserted in every mutant.
+        top_module (str): Top module passed to ebmc.
+        jobs (int): Number of concurrent ebmc runs (None: one per core).
+        timeout (float): Per-mutant time limit in seconds.
+        bound (int): Bounded model checking depth.
+        journal_path (str): Journal to record results in and resume from.
 
     Returns:
-        None
+        list: Files whose verification failed or timed out.
     """
     print("The directory is: ",directory)
     # Check if the directory exists
@@ -418,18 +833,18 @@ def run_fm_on_verilog_files(directory, properties, sby_path="sby"):
         print(f"Error: Directory '{directory}' does not exist.")
         return
 
-    # Get all Verilog files matching mutant_*.sv in the directory
-    verilog_files = [
-        os.path.join(directory, file)
-        for file in os.listdir(directory)
-        if file.startswith("mutant_") and file.endswith(".sv") and not file.endswith("_assertion.sv")
-    ]
-
-    verilog_related_files =[
-        os.path.join(directory, file)
-        for file in os.listdir(directory)
-        if not file.startswith("mutant_") and file.endswith(".sv") and not file.endswith("_assertion.sv")
-    ]
+    pack = None
+    if os.path.isfile(os.path.join(directory, MutantStore.PACK_NAME)):
+        # the pack index lists the mutants, no directory scan needed
+        pack = MutantPack(directory)
+        verilog_files = [os.path.join(directory, name) for name in pack.names()]
+    else:
+        # Get all Verilog files matching mutant_*.sv in the directory
+        verilog_files = sorted(
+            os.path.join(directory, file)
+            for file in os.listdir(directory)
+            if file.startswith("mutant_") and file.endswith(".sv") and not file.endswith("_assertion.sv")
+        )
 
     if not verilog_files:
         print("No matching Verilog files found in the specified directory.")
@@ -437,24 +852,12 @@ def run_fm_on_verilog_files(directory, properties, sby_path="sby"):
 
     print(f"Found {len(verilog_files)} Verilog files. Starting to process...")
 
+    scheduler = VerificationScheduler(top_module, properties, jobs=jobs, timeout=timeout,
+                                      bound=bound, journal_path=journal_path, pack=pack)
     error_files = []  # List to track files with errors
-    thread_result = []
-    with ProcessPoolExecutor() as executor:
-        futures = [
-            executor.submit(run_fm_on_verilog_file, verilog_file, properties, verilog_related_files)
-            for verilog_file in verilog_files
-        ]
-        for future in futures:
-            thread_result += future.result()
-    
-    
-    for result in thread_result:
-        filename = result.keys()
-        value = result.values()
-        if list(value)[0] == "error":
-            error_files.append(list(filename)[0])
-        if list(value)[0] == "timeout":
-            error_files.append(list(filename)[0])
+    for entry in scheduler.run(verilog_files):
+        if entry["status"] in ("error", "timeout"):
+            error_files.append(entry["file"])
     return error_files
 
 def move_files(src_folder, dest_folder,delete_file):
@@ -526,20 +929,23 @@ if __name__ == "__main__":
 
     # output_dir = "mutants"
     
-    # Generate mutants
     mutation_tool = SmartVerilogMutation(input_file, output_dir)
-    file_count = mutation_tool.run()
-    
+
     # Setup the environment
     move_files(input_file_dir, output_dir, input_file)
 
-    # Run ebmc on the generated mutants and remove error files
+    # Generate mutants, running ebmc on each as soon as it is generated,
+    # and remove error files
     # bad_files = []
     bad_files = set()
     properties = ["1'b1"]
 
     if top_module in mutant_check_list:
-        bad_files = run_fm_on_verilog_files(output_dir,properties)
+        pipeline = CampaignPipeline(mutation_tool, top_module, properties)
+        bad_files = [entry["file"] for entry in pipeline.run() if entry["status"] in ("error", "timeout")]
+    else:
+        mutation_tool.run()
+    file_count = mutation_tool.kept
     
     remove_files(bad_files)
 
@@ -3,25 +3,180 @@
 # 
 # Author: Adwait Godbole (adwait@berkeley.edu)
 
+import math
 import random
-from pyverilog.vparser.ast import Node, Unot, Rvalue, IntConst
-from pyverilog.dataflow.visit import NodeVisitor
+import hashlib
+import itertools
+from collections import namedtuple
+from contextlib import contextmanager
+from pyverilog.vparser.ast import (
+    Node, Unot, Rvalue, IntConst, Assign, IfStatement, ModuleDef,
+    And, Or, Xor, Xnor, Land, Lor, Plus, Minus, Times, Divide, Mod,
+    Eq, NotEq, Eql, NotEql, LessThan, GreaterThan, LessEq, GreaterEq,
+)
+
+from .splice import Edit
+from .utils import derive_rng
+from .instrument import recorder
+
+def node_children(node):
+    """
+    Return the child nodes of a node, flattening lists of nodes.
+    """
+    children = []
+    for c in node.children():
+        if isinstance(c, Node):
+            children.append(c)
+        elif isinstance(c, list):
+            children.extend(elem for elem in c if isinstance(elem, Node))
+    return children
+
+class Perturber:
+    """
+    Base class of the perturbation strategies.
+    A strategy lists the node types it acts on in `node_types`, says in
+    `accepts` whether a node is a mutation site, and mutates a single site in
+    `mutate`; the tree walk itself is left to CompositePerturber (sweeping
+    every site) or SiteIndex (targeting individual sites).
+    """
+    name = ""
+    node_types = ()
 
-class Perturber(NodeVisitor):
     def __init__(self, config=None):
         self.config = config
+        # random choices are drawn per site from streams derived from the
+        # seed, so they do not depend on traversal order or worker count
+        seed = config.seed if config is not None else None
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        # every change made, for incremental code generation (see splice.py)
+        self.edits = []
+        # (object, attribute, old value) of every change, while recording
+        self.undo_log = None
+
+    def accepts(self, node):
+        return True
+
+    def mutate(self, node, path=()):
+        raise NotImplementedError
+
+    def perturb(self, node, path=()):
+        """
+        Sweep step, called for every node of a handled type with its
+        child-index path from the root.
+        """
+        if self.accepts(node):
+            self.mutate(node, path)
+
+    def site_rng(self, path, *keys):
+        """
+        Return the random stream of the site at `path`.
+        """
+        return derive_rng(self.seed, self.name, *keys, *path)
+
+    def replace(self, obj, attr, value):
+        """
+        Set an AST attribute, logging the old value so it can be undone.
+        """
+        if self.undo_log is not None:
+            self.undo_log.append((obj, attr, getattr(obj, attr)))
+        setattr(obj, attr, value)
 
     def apply(self, ast):
-        self.visit(ast)
+        CompositePerturber([self]).apply(ast)
+
+class CompositePerturber:
+    """
+    Apply several strategies in a single traversal of the AST.
+    Every node is handed to the strategies registered for its type, in the
+    order given, once its children have been visited.
+    """
+    def __init__(self, perturbers):
+        self.perturbers = list(perturbers)
+        self.dispatch = {}
+        for perturber in self.perturbers:
+            for node_type in perturber.node_types:
+                self.dispatch.setdefault(node_type, []).append(perturber)
+        # sites left alone by the last `apply` as outside the output cone
+        self.pruned = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the composite of the strategies enabled in a FaultInjConfig.
+        """
+        perturbers = []
+        if config.flip_assigns:
+            perturbers.append(AssignmentFlipper(config=config))
+        if config.invert_logic:
+            perturbers.append(LogicInverter(config=config))
+        if config.change_constants:
+            perturbers.append(ConstChanger(config=config))
+        if config.randomize_assignments:
+            perturbers.append(AssignmentRandomizer(config=config))
+        if config.mutate_operators:
+            perturbers.append(OperatorMutator(config=config))
+        return cls(perturbers)
+
+    @property
+    def edits(self):
+        return [edit for perturber in self.perturbers for edit in perturber.edits]
+
+    def apply(self, ast, cone=None):
+        """
+        Perturb every site of the AST. With `cone` (a prune.ConeOfInfluence),
+        sites whose statement only assigns signals outside the output cone
+        of their module are left alone.
+        """
+        # iterative post-order walk, so deep expressions cannot overflow the stack
+        dispatch = self.dispatch
+        visited_nodes = 0
+        dispatched = 0
+        pruned = 0
+        # the nodes from the root down to the one visited
+        chain = []
+        stack = [(ast, (), False)]
+        while stack:
+            node, path, visited = stack.pop()
+            if visited:
+                visited_nodes += 1
+                perturbers = dispatch.get(type(node), ())
+                if perturbers and cone is not None and not cone.is_live_node(chain):
+                    pruned += sum(1 for perturber in perturbers if perturber.accepts(node))
+                    perturbers = ()
+                for perturber in perturbers:
+                    perturber.perturb(node, path)
+                    dispatched += 1
+                chain.pop()
+                continue
+            stack.append((node, path, True))
+            chain.append(node)
+            children = node_children(node)
+            for i in reversed(range(len(children))):
+                stack.append((children[i], path + (i,), False))
+        recorder.count("sites.visited", visited_nodes)
+        # one per strategy handed a node
+        recorder.count("sites.dispatched", dispatched)
+        if cone is not None:
+            recorder.count("sites.pruned", pruned)
+        self.pruned = pruned
+        for perturber in self.perturbers:
+            recorder.count(f"sites.mutated.{perturber.name}", len(perturber.edits))
 
 class AssignmentFlipper(Perturber):
     """
     Flip the RHS of every Assign by applying Unot to the inner term of Rvalue,
     """
+    name = "assignment_flipping"
+    node_types = (Assign,)
+
     def __init__(self, config=None):
         super().__init__(config)
         
-    def visit_Assign(self, node):
+    def accepts(self, node):
+        rhs = node.right
+        return not isinstance(rhs.var if isinstance(rhs, Rvalue) else rhs, Unot)
+
+    def mutate(self, node, path=()):
         """
         Flip the RHS of every Assign by applying Unot to the inner term of Rvalue, unless already Unot.
         """
@@ -30,55 +185,55 @@ class AssignmentFlipper(Perturber):
         if isinstance(rhs, Rvalue):
             expr = rhs.var
             if not isinstance(expr, Unot):
-                rhs.var = Unot(expr)
+                self.replace(rhs, "var", Unot(expr))
+                self.edits.append(Edit("negate_rvalue", node))
         # If right is not an Rvalue, fallback to previous logic
         elif not isinstance(rhs, Unot):
-            node.right = Unot(rhs)
-        # Continue walking into the left‐hand side (and any other children)
-        self.visit(node.left)
-        self.generic_visit(node)
-
-    def generic_visit(self, node):
-        """
-        Override the base generic_visit to:
-         - skip non-Node objects
-         - descend into both single Node children and lists of Nodes
-        """
-        if not isinstance(node, Node):
-            return
-
-        for c in node.children():
-            if isinstance(c, Node):
-                self.visit(c)
-            elif isinstance(c, list):
-                for elem in c:
-                    if isinstance(elem, Node):
-                        self.visit(elem)
+            self.replace(node, "right", Unot(rhs))
+            self.edits.append(Edit("negate_rvalue", node))
 
 class LogicInverter(Perturber):
     """
     Invert conditions in IfStatement nodes by wrapping them in Unot.
     """
+    name = "invert_logic"
+    node_types = (IfStatement,)
+
     def __init__(self, config=None):
         super().__init__(config)
 
-    def visit_IfStatement(self, node):
+    def accepts(self, node):
+        return not isinstance(node.cond, Unot)
+
+    def mutate(self, node, path=()):
         cond = node.cond
         if not isinstance(cond, Unot):
-            node.cond = Unot(cond)
-        self.generic_visit(node)
+            self.replace(node, "cond", Unot(cond))
+            self.edits.append(Edit("negate_condition", node))
 
 class ConstChanger(Perturber):
     """
     Flip single-bit constants, invert all bits for multi-bit constants.
     """
+    name = "change_constants"
+    node_types = (IntConst,)
 
     def __init__(self, config=None):
         super().__init__(config)
 
-    def visit_IntConst(self, node):
-        # Flip single-bit constants, invert all bits for multi-bit
+    def accepts(self, node):
+        return self.changed_value(node.value) != node.value
+
+    def mutate(self, node, path=()):
         value_str = node.value
+        new_value = self.changed_value(value_str)
+        if new_value != value_str:
+            self.replace(node, "value", new_value)
+            self.edits.append(Edit("constant", node, value_str))
+
+    @staticmethod
+    def changed_value(value_str):
+        # Flip single-bit constants, invert all bits for multi-bit
         # Handle binary, hex, decimal, etc.
         if "'" in value_str:
             width, baseval = value_str.split("'")
@@ -87,49 +242,271 @@ class ConstChanger(Perturber):
             if base == 'b':
                 # Invert all bits
                 flipped = ''.join('1' if c == '0' else '0' for c in val)
-                node.value = f"{width}'b{flipped}"
+                return f"{width}'b{flipped}"
             elif base == 'h':
                 # Invert hex by flipping all bits
                 nbits = int(width)
                 intval = int(val, 16)
                 mask = (1 << nbits) - 1
                 flipped = hex(intval ^ mask)[2:]
-                node.value = f"{width}'h{flipped}"
+                return f"{width}'h{flipped}"
             elif base == 'd':
                 nbits = int(width)
                 intval = int(val, 10)
                 mask = (1 << nbits) - 1
                 flipped = str(intval ^ mask)
-                node.value = f"{width}'d{flipped}"
+                return f"{width}'d{flipped}"
             else:
                 # Unknown base, skip
-                pass
+                return value_str
         else:
             # No width/base, treat as decimal and flip 0/1
             if value_str == "0":
-                node.value = "1"
+                return "1"
             elif value_str == "1":
-                node.value = "0"
+                return "0"
             else:
                 # For other values, invert all bits
                 intval = int(value_str)
                 nbits = intval.bit_length()
                 mask = (1 << nbits) - 1
-                node.value = str(intval ^ mask)
+                return str(intval ^ mask)
 
 class AssignmentRandomizer(Perturber):
     """
     Randomly change the RHS of assignments to random constants (0 or 1).
     """
+    name = "randomize_assignments"
+    node_types = (Assign,)
+
     def __init__(self, config=None):
         super().__init__(config)
 
-    def visit_Assign(self, node):
+    def perturb(self, node, path=()):
         # With 50% probability, replace RHS with a random constant (0 or 1)
-        if random.random() < 0.5:
-            rand_val = str(random.randint(0, 1))
-            if isinstance(node.right, Rvalue):
-                node.right.var = IntConst(rand_val)
+        if self.site_rng(path, "select").random() < 0.5:
+            self.mutate(node, path)
+
+    def mutate(self, node, path=()):
+        rand_val = str(self.site_rng(path).randint(0, 1))
+        if isinstance(node.right, Rvalue):
+            self.replace(node.right, "var", IntConst(rand_val))
+        else:
+            self.replace(node, "right", IntConst(rand_val))
+        self.edits.append(Edit("replace_rvalue", node))
+
+# Binary operators by the SmartVerilog category they belong to. An operator
+# is only ever replaced by another one of its own group.
+OPERATOR_GROUPS = {
+    "bitwise": (And, Or, Xor, Xnor),
+    "logical": (Land, Lor),
+    "arithmatic": (Plus, Minus, Times, Divide, Mod),
+    "relational": (Eq, NotEq, Eql, NotEql, LessThan, GreaterThan, LessEq, GreaterEq),
+}
+OPERATOR_CATEGORIES = {op: category for category, ops in OPERATOR_GROUPS.items() for op in ops}
+
+class OperatorMutator(Perturber):
+    """
+    Replace binary operators with another operator of the same group, e.g.
+    `&` with `|` or `<` with `>=`, the replacement being drawn per site.
+    Working on the AST, it never touches comments, strings, port ranges
+    without operators or `<=` assignments.
+    """
+    name = "operator_mutation"
+    node_types = tuple(OPERATOR_CATEGORIES)
+
+    def __init__(self, config=None):
+        super().__init__(config)
+
+    def replacement(self, node, path=()):
+        """
+        Return the operator class the node at `path` is mutated to.
+        """
+        group = OPERATOR_GROUPS[OPERATOR_CATEGORIES[type(node)]]
+        return self.site_rng(path).choice([op for op in group if op is not type(node)])
+
+    def mutate(self, node, path=()):
+        original = type(node)
+        # all binary operators share their fields, so switching the class
+        # of the node is enough
+        self.replace(node, "__class__", self.replacement(node, path))
+        self.edits.append(Edit("operator", node, original))
+
+# A candidate mutation site: its position in the SiteIndex, the child-index
+# path from the root to its node, the strategy that mutates it, and the
+# enclosing module and source line.
+Site = namedtuple("Site", ["index", "path", "kind", "module", "lineno"])
+
+class _RandomPermutation:
+    """
+    A random permutation of range(n), drawn from `rng` and evaluated one
+    index at a time in constant memory: a Feistel network over the smallest
+    even number of bits covering n, cycle-walking back into range.
+    """
+    ROUNDS = 4
+
+    def __init__(self, n, rng):
+        self.n = n
+        self.half = max(1, ((n - 1).bit_length() + 1) // 2) if n > 0 else 1
+        self.mask = (1 << self.half) - 1
+        self.keys = [rng.getrandbits(64).to_bytes(8, "big") for _ in range(self.ROUNDS)]
+
+    def _round(self, key, x):
+        digest = hashlib.blake2b(x.to_bytes((self.half + 7) // 8, "big"), key=key,
+                                 digest_size=(self.half + 7) // 8).digest()
+        return int.from_bytes(digest, "big") & self.mask
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        x = i
+        while True:
+            left, right = x >> self.half, x & self.mask
+            for key in self.keys:
+                left, right = right, left ^ self._round(key, right)
+            x = (left << self.half) | right
+            if x < self.n:
+                return x
+
+
+def _unrank_combination(rank, n, k):
+    """
+    Return the k-subset of range(n) of the given rank (in the combinatorial
+    number system), as increasing indices.
+    """
+    picks = []
+    for i in range(k, 0, -1):
+        # the largest c with C(c, i) <= rank
+        low, high = i - 1, n - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if math.comb(mid, i) <= rank:
+                low = mid
             else:
-                node.right = IntConst(rand_val)
-        self.generic_visit(node)
+                high = mid - 1
+        picks.append(low)
+        rank -= math.comb(low, i)
+        n = low
+    return picks[::-1]
+
+
+class SiteIndex:
+    """
+    Index of every mutation site of the given strategies in an AST.
+    The index is built with one traversal, keeping a reference to the node of
+    every site and to the parent of every node; afterwards any single site
+    (or set of sites) is mutated directly and restored from the undo log, so
+    one AST serves every variant.
+    """
+    def __init__(self, ast, perturbers):
+        self.ast = ast
+        self.perturbers = {perturber.name: perturber for perturber in perturbers}
+        self.sites = []
+        # the node of every site, by site index
+        self.nodes = []
+        # id(node) -> parent node, along the indexed paths
+        self.parents = {}
+        dispatch = {}
+        for perturber in perturbers:
+            for node_type in perturber.node_types:
+                dispatch.setdefault(node_type, []).append(perturber)
+
+        seen = set()
+        stack = [(ast, (), None, None)]
+        while stack:
+            node, path, module, parent = stack.pop()
+            # pyverilog shares some subtrees; index each node once
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if parent is not None:
+                self.parents[id(node)] = parent
+            if isinstance(node, ModuleDef):
+                module = node.name
+            for perturber in dispatch.get(type(node), ()):
+                if perturber.accepts(node):
+                    self.sites.append(Site(len(self.sites), path, perturber.name, module, node.lineno))
+                    self.nodes.append(node)
+            children = node_children(node)
+            for i in reversed(range(len(children))):
+                stack.append((children[i], path + (i,), module, node))
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __getitem__(self, index):
+        return self.sites[index]
+
+    def __iter__(self):
+        return iter(self.sites)
+
+    def node(self, site):
+        """
+        Return the node of a site.
+        """
+        return self.nodes[site.index]
+
+    def ancestors(self, site):
+        """
+        Return the nodes from the root down to the node of a site, in O(depth).
+        """
+        node = self.nodes[site.index]
+        chain = [node]
+        while id(node) in self.parents:
+            node = self.parents[id(node)]
+            chain.append(node)
+        chain.reverse()
+        return chain
+
+    def sample(self, k, rng=None, pool=None):
+        """
+        Return `k` distinct sites drawn at random from `pool` (by default
+        every site), or the whole pool if k >= its size.
+        """
+        rng = rng if rng is not None else random
+        pool = self.sites if pool is None else list(pool)
+        if k >= len(pool):
+            return list(pool)
+        return [pool[i] for i in sorted(rng.sample(range(len(pool)), k))]
+
+    def combinations(self, k, pool=None, rng=None, limit=None):
+        """
+        Lazily yield tuples of `k` distinct sites (from `pool`, by default
+        every site), at most `limit` of them. Without an `rng` they come in
+        lexicographic order; with one, in random order without repetition:
+        the i-th is unranked from a random permutation of the C(n, k) ranks,
+        so neither that space nor the combinations drawn are held in memory,
+        and each costs the same however many came before.
+        """
+        pool = list(self.sites) if pool is None else list(pool)
+        if rng is None:
+            yield from itertools.islice(itertools.combinations(pool, k), limit)
+            return
+        count = math.comb(len(pool), k)
+        total = count if limit is None else min(count, limit)
+        permutation = _RandomPermutation(count, rng)
+        for i in range(total):
+            yield tuple(pool[j] for j in _unrank_combination(permutation[i], len(pool), k))
+
+    @contextmanager
+    def mutated(self, sites):
+        """
+        Mutate the given sites for the duration of the block, yielding the
+        edits made; the AST is restored on exit.
+        """
+        undo_log = []
+        edits = []
+        try:
+            for site in sites:
+                perturber = self.perturbers[site.kind]
+                perturber.undo_log = undo_log
+                perturber.edits = edits
+                try:
+                    perturber.mutate(self.node(site), site.path)
+                finally:
+                    perturber.undo_log = None
+                    perturber.edits = []
+            yield edits
+        finally:
+            for obj, attr, value in reversed(undo_log):
+                setattr(obj, attr, value)
@@ -0,0 +1,254 @@
+# pipeline.py
+# Pipelined mutation campaign: generate -> screen -> verify.
+#
+# The three stages run at once, on their own threads, connected by bounded
+# queues: a mutant is screened as soon as it is generated and handed to ebmc
+# as soon as it passes, so the verification pool starts with the first mutant
+# instead of after the last one. A full queue blocks the stage feeding it,
+# so however far generation could run ahead, at most `queue_size` mutants
+# wait between two stages.
+
+import os
+import json
+import queue
+import threading
+import itertools
+from contextlib import closing
+
+from .scheduler import VerificationScheduler
+from .screen import Screener
+from .store import MutantPack
+from .instrument import recorder
+
+# end of a stage's output
+_DONE = object()
+
+
+def is_kept(meta_info):
+    """
+    True if the record is that of a mutant the tool stored (and wrote):
+    not a duplicate, rejected, pruned or left out of the sample.
+    """
+    return (meta_info["duplicate_of"] is None and meta_info["screen"] is None
+            and meta_info["live"] is not False and meta_info["sampled"] is not False)
+
+
+class CampaignPipeline:
+    """
+    Generate the mutants of a SmartVerilogMutation, screen them and verify
+    them with ebmc, the stages overlapping:
+      generate  `tool.iter_mutants()`, with its lexical pre-screen
+      screen    keeps the mutants to verify (not duplicate, rejected,
+                pruned or left out of the sample) and, with `parse`, parses
+                each with pyverilog (build the tool without `screen_parse`,
+                so the parse moves here from generation)
+      verify    `jobs` concurrent ebmc runs (see VerificationScheduler),
+                resuming from `journal_path` like `VerificationScheduler.run`
+    Mutants rejected by the parse are recorded in `self.rejected` and their
+    files removed; once the stages are done, their table records (if the
+    tool keeps records) get the reason in `screen`, and they are left out
+    of the saved store or pack. Which mutants to verify is decided from
+    their records, so the tool need not keep its records (see
+    `SmartVerilogMutation.iter_mutants`).
+    """
+    STAGES = ("generate", "screen", "verify")
+
+    def __init__(self, tool, top_module, properties=("1'b1",), jobs=None, timeout=30, bound=10,
+                 journal_path=None, ebmc_path="ebmc", queue_size=64, parse=False):
+        self.tool = tool
+        self.parse = parse
+        self.scheduler = VerificationScheduler(top_module, properties, jobs=jobs, timeout=timeout, bound=bound,
+                                               journal_path=journal_path, ebmc_path=ebmc_path)
+        self.queue_size = queue_size
+        self.screener = None
+        self.rejected = {}
+        self.errors = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.queues = {}
+        # per stage: mutants passed on, and mutants dropped
+        self.counts = {stage: {"done": 0, "dropped": 0} for stage in self.STAGES}
+
+    def progress(self) -> dict:
+        """
+        Return the counts of every stage, with the length of its input queue.
+        """
+        with self.lock:
+            progress = {stage: dict(counts) for stage, counts in self.counts.items()}
+        for stage, q in self.queues.items():
+            progress[stage]["queued"] = q.qsize()
+        return progress
+
+    def _count(self, stage, key="done"):
+        with self.lock:
+            self.counts[stage][key] += 1
+        recorder.count(f"pipeline.{stage}.{key}")
+
+    def _put(self, q, item):
+        # blocks while the queue is full (backpressure), unless stopped
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _stage(self, stage, target, *args):
+        """
+        Run a stage; a failure stops the whole pipeline.
+        """
+        try:
+            with recorder.span(f"pipeline.{stage}"):
+                target(*args)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop.set()
+
+    def _generate(self, output):
+        try:
+            with closing(self.tool.iter_mutants()) as mutants:
+                for meta_info in mutants:
+                    self._count("generate")
+                    if not self._put(output, meta_info):
+                        break
+        finally:
+            self._put(output, _DONE)
+
+    def _screen(self, input, output, consumers):
+        tool = self.tool
+        try:
+            while True:
+                meta_info = self._get(input)
+                if meta_info is _DONE:
+                    break
+                mutation_id = meta_info["mutation_id"]
+                if not is_kept(meta_info):
+                    self._count("screen", "dropped")
+                    continue
+                if self.parse:
+                    reason = self._parse_check(meta_info)
+                    if reason is not None:
+                        self.rejected[mutation_id] = reason
+                        recorder.count(f"mutants.rejected.{reason}")
+                        self._count("screen", "dropped")
+                        path = os.path.join(tool.output_dir, MutantPack.member_name(mutation_id))
+                        if os.path.exists(path):
+                            os.remove(path)
+                        continue
+                if (tool.pack or not tool.write_mutants) and self.scheduler.pack is None:
+                    # no mutant files: ebmc inputs come from the store as it
+                    # fills (it only exists once generation has started)
+                    self.scheduler.pack = tool.store
+                self._count("screen")
+                if not self._put(output, os.path.join(tool.output_dir, MutantPack.member_name(mutation_id))):
+                    break
+        finally:
+            for _ in range(consumers):
+                self._put(output, _DONE)
+
+    def _parse_check(self, meta_info):
+        tool = self.tool
+        if self.screener is None:
+            # built on the first mutant, once generation is done parsing
+            self.screener = Screener(tool.code_lines, parse=True)
+        mutation_id = meta_info["mutation_id"]
+        line_no = meta_info["line"] - 1
+        line = tool.store.line(line_no)
+        patch = tool.store.patches.get(mutation_id)
+        if patch is not None:
+            _, start, end, replacement = patch
+            encoded = line.encode()
+            mutated_line = (encoded[:start] + replacement + encoded[end:]).decode()
+        else:
+            # written, and dropped from the store (keep_records False)
+            path = os.path.join(tool.output_dir, MutantPack.member_name(mutation_id))
+            with open(path) as file:
+                mutated_line = next(itertools.islice(file, line_no, None))
+        return self.screener.check(line_no, line, mutated_line)
+
+    def _drop_rejected(self):
+        """
+        Record the parse rejections in the tool's table and remove their
+        mutants from its store, then save both again. Done once every stage
+        has stopped, as generation saves them when it ends, possibly while
+        mutants are still being screened.
+        """
+        tool = self.tool
+        for mutation_id, reason in self.rejected.items():
+            if tool.keep_records:
+                tool.table.update(mutation_id, screen=reason)
+            tool.store.discard(mutation_id)
+        tool.save_outputs()
+
+    def _verify(self, input, output, recorded, journal):
+        scheduler = self.scheduler
+        try:
+            while True:
+                verilog_file = self._get(input)
+                if verilog_file is _DONE:
+                    break
+                entry = recorded.get(verilog_file)
+                if entry is None:
+                    entry = scheduler.run_one(verilog_file)
+                    if journal is not None:
+                        with self.lock:
+                            journal.write(json.dumps(entry) + "\n")
+                            journal.flush()
+                self._count("verify")
+                if not self._put(output, entry):
+                    break
+        finally:
+            self._put(output, _DONE)
+
+    def run(self):
+        """
+        Run the campaign, yielding each verification result entry as soon
+        as it is available.
+        """
+        scheduler = self.scheduler
+        recorded = scheduler.load_journal()
+        workers = scheduler.jobs
+        generated = self.queues["screen"] = queue.Queue(self.queue_size)
+        screened = self.queues["verify"] = queue.Queue(self.queue_size)
+        results = queue.Queue(self.queue_size)
+        journal = open(scheduler.journal_path, "a") if scheduler.journal_path is not None else None
+        threads = [threading.Thread(target=self._stage, args=("generate", self._generate, generated)),
+                   threading.Thread(target=self._stage, args=("screen", self._screen, generated, screened, workers))]
+        threads += [threading.Thread(target=self._stage, args=("verify", self._verify, screened, results, recorded, journal))
+                    for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            remaining = workers
+            while remaining:
+                entry = self._get(results)
+                if entry is _DONE:
+                    remaining -= 1
+                    continue
+                progress = self.progress()
+                recorder.log(f"[generated {progress['generate']['done']}"
+                             f" | screened {progress['screen']['done']} ({progress['screen']['queued']} queued)"
+                             f" | verified {progress['verify']['done']} ({progress['verify']['queued']} queued)]"
+                             f" {entry['status']}: {entry['file']} ({entry['elapsed']:.1f}s)")
+                yield entry
+        finally:
+            # on interruption or failure, the stages stop at their next
+            # queue operation; running ebmc checks finish
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            if journal is not None:
+                journal.close()
+            if self.rejected:
+                self._drop_rejected()
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,190 @@
+# prune.py
+# Static pruning of mutation sites outside the output cone of influence.
+#
+# A mutation of a signal that never reaches a module output cannot be
+# observed, so its mutant is a guaranteed survivor. The cone of every module
+# is computed with pyverilog's dataflow analysis (each module elaborated as
+# its own top), and a site is dead when every signal its statement assigns is
+# a known signal of the module outside that cone. Anything the analysis does
+# not cover is conservatively kept.
+
+from pyverilog.vparser.ast import (
+    ModuleDef, Assign, BlockingSubstitution, NonblockingSubstitution,
+    IfStatement, CaseStatement, CasexStatement, CasezStatement,
+    Lvalue, Identifier, Pointer, Partselect, LConcat,
+)
+from pyverilog.dataflow.modulevisitor import ModuleVisitor
+from pyverilog.dataflow.signalvisitor import SignalVisitor
+from pyverilog.dataflow.bindvisitor import BindVisitor
+
+from .utils import mask_comments
+from .screen import ASSIGNMENT_RE
+from .perturbations import node_children
+from .instrument import recorder
+
+SUBSTITUTIONS = (Assign, BlockingSubstitution, NonblockingSubstitution)
+CONTROL = (IfStatement, CaseStatement, CasexStatement, CasezStatement)
+
+
+def lvalue_names(node):
+    """
+    Return the names of the signals an lvalue assigns.
+    """
+    if isinstance(node, Lvalue):
+        return lvalue_names(node.var)
+    if isinstance(node, Identifier):
+        return {node.name}
+    if isinstance(node, (Pointer, Partselect)):
+        return lvalue_names(node.var)
+    if isinstance(node, LConcat):
+        return set().union(*(lvalue_names(n) for n in node.list))
+    return set()
+
+
+def assigned_in(node):
+    """
+    Return the names of the signals assigned anywhere below a statement.
+    """
+    names = set()
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if isinstance(n, SUBSTITUTIONS):
+            names |= lvalue_names(n.left)
+        else:
+            stack.extend(node_children(n))
+    return names
+
+
+def _terminals(tree):
+    """
+    Return the names of the signals a dataflow tree reads.
+    """
+    names = []
+    stack = [tree]
+    while stack:
+        n = stack.pop()
+        if n is None:
+            continue
+        name = getattr(n, "name", None)
+        if name is not None and hasattr(name, "scopechain"):
+            names.append(name)
+        stack.extend(n.children())
+    return names
+
+
+def _module_cone(moduleinfotable, module):
+    """
+    Elaborate `module` as the top and return (signals, live): the names of
+    its own signals and of those that reach one of its outputs.
+    """
+    signal_visitor = SignalVisitor(moduleinfotable, module)
+    signal_visitor.start_visit()
+    bind_visitor = BindVisitor(moduleinfotable, module, signal_visitor.getFrameTable(), noreorder=True)
+    bind_visitor.start_visit()
+    dataflow = bind_visitor.getDataflows()
+    terms = dataflow.getTerms()
+    binddict = dataflow.getBinddict()
+
+    stack = [name for name, term in terms.items()
+             if term.termtype & {"Output", "Inout"} and len(name.scopechain) == 2]
+    cone = set(stack)
+    while stack:
+        name = stack.pop()
+        for bind in binddict.get(name, ()):
+            sources = _terminals(bind.tree) + _terminals(bind.msb) + _terminals(bind.lsb) + _terminals(bind.ptr)
+            if bind.alwaysinfo is not None:
+                sources += [n for n in (bind.alwaysinfo.clock_name, bind.alwaysinfo.reset_name)
+                            if hasattr(n, "scopechain")]
+            for source in sources:
+                if source not in cone:
+                    cone.add(source)
+                    stack.append(source)
+
+    def local(names):
+        return {name.scopechain[-1].scopename for name in names if len(name.scopechain) == 2}
+    return local(terms), local(cone)
+
+
+class ConeOfInfluence:
+    """
+    Per-module output cones of a parsed design.
+    Modules the dataflow analysis cannot elaborate are treated as live.
+    """
+    def __init__(self, ast):
+        module_visitor = ModuleVisitor()
+        module_visitor.visit(ast)
+        moduleinfotable = module_visitor.get_moduleinfotable()
+        self.signals = {}
+        self.live = {}
+        for module in module_visitor.get_modulenames():
+            try:
+                self.signals[module], self.live[module] = _module_cone(moduleinfotable, module)
+            except Exception as e:
+                recorder.log(f"Warning: dataflow analysis of module {module} failed ({type(e).__name__}: {e}), keeping all of its sites.")
+        # module start lines, to place source lines in their module
+        self.module_lines = sorted((node.lineno, node.name) for node in ast.description.definitions
+                                   if isinstance(node, ModuleDef))
+
+    def is_live(self, module, names):
+        """
+        True unless every one of the names is a known signal of the module
+        outside its cone.
+        """
+        if module not in self.live or not names:
+            return True
+        return any(name not in self.signals[module] or name in self.live[module] for name in names)
+
+    def statement_targets(self, chain):
+        """
+        Return the signals assigned by the innermost statement of a chain of
+        nodes (root first), or None if the chain is not inside a statement
+        (declarations, ports, ...).
+        """
+        for node in reversed(chain):
+            if isinstance(node, SUBSTITUTIONS):
+                return lvalue_names(node.left)
+            if isinstance(node, CONTROL):
+                return assigned_in(node)
+        return None
+
+    def site_targets(self, index, site):
+        """
+        Return the signals assigned by the statement a site mutates, or None
+        if the site is not inside a statement.
+        """
+        return self.statement_targets(index.ancestors(site))
+
+    def is_live_site(self, index, site):
+        """
+        True unless the site's statement only assigns dead signals.
+        """
+        return self.is_live(site.module, self.site_targets(index, site))
+
+    def is_live_node(self, chain):
+        """
+        True unless the statement of the last node of a chain (the nodes from
+        the root down to it) only assigns dead signals.
+        """
+        module = next((node.name for node in chain if isinstance(node, ModuleDef)), None)
+        return self.is_live(module, self.statement_targets(chain))
+
+    def module_at(self, lineno):
+        """
+        Return the module a (1-based) source line belongs to.
+        """
+        module = None
+        for start, name in self.module_lines:
+            if start > lineno:
+                break
+            module = name
+        return module
+
+    def is_live_line(self, line_no, line):
+        """
+        True unless the (0-based) source line assigns a dead signal.
+        """
+        m = ASSIGNMENT_RE.match(mask_comments(line))
+        if m is None:
+            return True
+        return self.is_live(self.module_at(line_no + 1), {m.group(1)})
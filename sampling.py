@@ -0,0 +1,66 @@
+# sampling.py
+# Budgeted, deterministic sampling of mutants.
+#
+# Exhaustive enumeration yields far more mutants than can be verified on big
+# netlists. A StratifiedSampler takes the candidates in a single pass and
+# keeps a bounded reservoir per category, so memory is bounded by the budget
+# rather than by the number of candidates. Every candidate gets a priority
+# derived from the seed and its key alone; a reservoir keeps the candidates
+# of lowest priority, so the sample is the same for a given seed whatever
+# order (or worker) the candidates come from.
+
+import heapq
+
+from .utils import derive_key
+
+
+class StratifiedSampler:
+    """
+    Sample at most `total` items, and at most `quotas` items of a category
+    (one count for every category, or a dict by category; categories it
+    does not name are only bounded by `total`). None means no limit.
+    """
+    def __init__(self, seed, total=None, quotas=None):
+        self.seed = seed
+        self.total = total
+        self.quotas = quotas
+        # category -> heap of (-priority, key, item): the root is the entry
+        # with the highest priority kept, the first to be displaced
+        self.reservoirs = {}
+        self.offered = {}
+
+    def capacity(self, category):
+        quota = self.quotas.get(category) if isinstance(self.quotas, dict) else self.quotas
+        limits = [limit for limit in (quota, self.total) if limit is not None]
+        return min(limits) if limits else None
+
+    def offer(self, category, key, item):
+        """
+        Offer one candidate; `key` must be unique among the candidates.
+        """
+        self.offered[category] = self.offered.get(category, 0) + 1
+        capacity = self.capacity(category)
+        if capacity == 0:
+            return
+        entry = (-derive_key(self.seed, "sample", key), key, item)
+        heap = self.reservoirs.setdefault(category, [])
+        if capacity is None or len(heap) < capacity:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def sample(self):
+        """
+        Return the sampled (key, item) pairs in key order. The total is
+        shared evenly between the categories: they take turns, each giving
+        its next item by priority, so a large category cannot crowd out a
+        small one.
+        """
+        ranked = []
+        for heap in self.reservoirs.values():
+            for rank, (priority, key, item) in enumerate(sorted(heap, reverse=True)):
+                ranked.append((rank, -priority, key, item))
+        ranked.sort(key=lambda entry: entry[:3])
+        if self.total is not None:
+            ranked = ranked[:self.total]
+        return sorted(((key, item) for _, _, key, item in ranked), key=lambda pair: pair[0])
@@ -0,0 +1,227 @@
+# scheduler.py
+# Formal verification of mutants on a pool of ebmc subprocesses.
+#
+# Every mutant is checked by one ebmc run against the given properties. Runs
+# are I/O-bound on their subprocess, so they are scheduled on threads; results
+# are streamed as they complete and appended to an optional journal, from
+# which an interrupted campaign resumes. Mutants are read either from their
+# own files or straight from a mutant pack (see store.py).
+
+import os
+import re
+import json
+import time
+import signal
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .store import MutantPack
+from .instrument import recorder
+
+
+def insert_assertions(content, assertions, name="<source>"):
+    """
+    Return the lines of a Verilog source with an `assert property` for every
+    assertion inserted right after the header of its first module.
+    """
+    module_start_found = False
+    module_end_found = False
+    modified_content = []
+
+    module_start_pattern = re.compile(r"^\s*module\s+\w+")
+    semicolon_pattern = re.compile(r";")
+
+    for i, line in enumerate(content):
+        # Check if the module declaration has been found
+        if not module_start_found and module_start_pattern.match(line):
+            module_start_found = True
+            modified_content.append(line)
+            continue
+        
+        if module_start_found and not module_end_found:
+            modified_content.append(line)
+            if semicolon_pattern.search(line):  
+                module_end_found = True
+                for assertion in assertions:
+                    modified_content.append(f"    assert property ({assertion});\n")
+            continue
+        
+
+        modified_content.append(line)
+
+    if not module_start_found:
+        print(f"Warning: {name} does not contain a module declaration.")
+    elif not module_end_found:
+        print(f"Warining: {name} does not contain a module end declaration.")
+    return modified_content
+
+
+def write_assertion_file(input_file, output_file, assertions):
+    """
+    Copy a Verilog file, inserting an `assert property` for every assertion
+    right after the header of its first module.
+    """
+    try:
+        with open(input_file, "r") as file:
+            content = file.readlines()
+
+        modified_content = insert_assertions(content, assertions, input_file)
+
+        with open(output_file, "w") as file:
+            file.writelines(modified_content)
+
+        # print(f"Assertions sucess {output_file}")
+
+    except FileNotFoundError:
+        print(f"Erorr: File '{input_file}' not found.")
+    except IOError as e:
+        print(f"Erorr: {e}")
+
+
+class VerificationScheduler:
+    """
+    Run ebmc on many Verilog files, `jobs` at a time (None: one per core),
+    each limited to `timeout` seconds and unrolled to `bound` cycles.
+    With a `journal_path`, every result is appended to that JSON-lines file
+    and files already recorded there are not run again.
+    With a `pack` (MutantPack, or a MutantStore), the files are mutant names
+    (`mutant_<id>.sv`, optionally with a directory) read from the pack
+    rather than from disk.
+    """
+    def __init__(self, top_module, properties=("1'b1",), jobs=None, timeout=30, bound=10,
+                 journal_path=None, ebmc_path="ebmc", pack=None):
+        self.top_module = top_module
+        self.properties = list(properties)
+        self.jobs = jobs if jobs is not None else os.cpu_count()
+        self.timeout = timeout
+        self.bound = bound
+        self.journal_path = journal_path
+        self.ebmc_path = ebmc_path
+        self.pack = pack
+
+    def command(self, verilog_file):
+        return [self.ebmc_path, verilog_file, "--bound", str(self.bound), "--top", self.top_module]
+
+    def run_one(self, verilog_file) -> dict:
+        """
+        Verify a single file, returning its result entry; the status is
+        "verified", "timeout" or "error".
+        """
+        with recorder.span("verify", file=verilog_file) as span:
+            entry = self._run_one(verilog_file)
+            span["status"] = entry["status"]
+        recorder.count(f"verify.{entry['status']}")
+        return entry
+
+    def _write_assertion_file(self, verilog_file):
+        """
+        Write the file ebmc is run on and return its path.
+        """
+        if self.pack is None:
+            file_base, file_ext = os.path.splitext(verilog_file)
+            assertion_file = f"{file_base}_assertion{file_ext}"
+            write_assertion_file(verilog_file, assertion_file, self.properties)
+            return assertion_file
+        # the pack may sit on a slow shared filesystem; the one file ebmc
+        # needs goes to local scratch space
+        mutant_id = MutantPack.mutant_id(verilog_file)
+        content = self.pack.materialize(mutant_id).splitlines(keepends=True)
+        fd, assertion_file = tempfile.mkstemp(prefix=f"mutant_{mutant_id}_", suffix="_assertion.sv")
+        with os.fdopen(fd, "w") as file:
+            file.writelines(insert_assertions(content, self.properties, verilog_file))
+        return assertion_file
+
+    def _run_one(self, verilog_file):
+        time_start = time.time()
+        assertion_file = None
+        entry = {"file": verilog_file, "status": "verified"}
+        try:
+            assertion_file = self._write_assertion_file(verilog_file)
+            # a session of its own, so that a timeout also stops whatever
+            # ebmc started (a solver, a shell wrapper's children)
+            process = subprocess.Popen(self.command(assertion_file), stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, text=True, start_new_session=True)
+            try:
+                process.communicate(timeout=self.timeout)
+            except BaseException:
+                self._kill(process)
+                raise
+            entry["returncode"] = process.returncode
+            if process.returncode != 0:
+                entry["status"] = "error"
+        except subprocess.TimeoutExpired:
+            entry["status"] = "timeout"
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            if assertion_file is not None and os.path.exists(assertion_file):
+                os.remove(assertion_file)
+        entry["elapsed"] = time.time() - time_start
+        return entry
+
+    @staticmethod
+    def _kill(process):
+        """
+        Kill the process group of an ebmc run and reap it.
+        """
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.communicate()
+
+    def load_journal(self) -> dict:
+        """
+        Return the results recorded in the journal, keyed by file.
+        """
+        results = {}
+        if self.journal_path is None or not os.path.exists(self.journal_path):
+            return results
+        with open(self.journal_path, "r") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interruption
+                    continue
+                results[entry["file"]] = entry
+        return results
+
+    def run(self, verilog_files):
+        """
+        Verify the files, yielding each result entry as soon as it is
+        available: first those found in the journal, then the others in
+        order of completion.
+        """
+        verilog_files = list(verilog_files)
+        recorded = self.load_journal()
+        pending = [file for file in verilog_files if file not in recorded]
+        total = len(verilog_files)
+        done = 0
+        for file in verilog_files:
+            if file in recorded:
+                done += 1
+                recorder.log(f"[{done}/{total}] {recorded[file]['status']}: {file} (journal)")
+                yield recorded[file]
+        if not pending:
+            return
+
+        journal = open(self.journal_path, "a") if self.journal_path is not None else None
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            futures = [executor.submit(self.run_one, file) for file in pending]
+            for future in as_completed(futures):
+                entry = future.result()
+                done += 1
+                if journal is not None:
+                    journal.write(json.dumps(entry) + "\n")
+                    journal.flush()
+                recorder.log(f"[{done}/{total}] {entry['status']}: {entry['file']} ({entry['elapsed']:.1f}s)")
+                yield entry
+        finally:
+            # on interruption, drop the queued runs; running ones finish
+            executor.shutdown(wait=True, cancel_futures=True)
+            if journal is not None:
+                journal.close()
@@ -0,0 +1,151 @@
+# screen.py
+# Syntax pre-screen for generated mutants.
+#
+# Many regex mutants are not legal Verilog. Since a mutant differs from its
+# source in a single line, most of them are caught by comparing that line
+# before and after the mutation: whatever the mutation broke shows up as a
+# difference in bracket balance, block nesting or statement shape. The
+# optional parse check hands the whole mutant to the shared pyverilog parser.
+
+import re
+
+from .utils import mask_comments
+
+# reason codes
+UNBALANCED_BRACKETS = "unbalanced_brackets"
+UNBALANCED_BLOCKS = "unbalanced_blocks"
+MISSING_OPERAND = "missing_operand"
+NEGATED_KEYWORD = "negated_keyword"
+BROKEN_ASSIGNMENT = "broken_assignment"
+INPUT_ASSIGNED = "input_assigned"
+PARSE_ERROR = "parse_error"
+
+BRACKETS = ("()", "[]", "{}")
+BLOCKS = (("begin", "end"), ("case", "endcase"), ("casex", "endcase"), ("casez", "endcase"),
+          ("fork", "join"), ("module", "endmodule"), ("function", "endfunction"),
+          ("task", "endtask"), ("generate", "endgenerate"))
+# a binary operator directly followed by a closer, or an opener directly
+# followed by a binary-only operator: an operand is missing
+MISSING_OPERAND_RES = (
+    re.compile(r"(?<![-+*/%<>=!&|^~])(?:[*/%&|^]\s*[:)\],;]|[-+]\s*[)\],;])"),
+    re.compile(r"[(\[,]\s*[*/%]"),
+)
+# a unary operator applied to a keyword rather than an operand
+NEGATED_KEYWORD_RE = re.compile(
+    r"[!~]\s*\b(?:begin|end|if|else|case|casex|casez|endcase|for|while|repeat|forever|"
+    r"assign|always|initial|module|endmodule|wire|reg|logic|input|output|inout|posedge|negedge)\b"
+)
+# the target of a (continuous, blocking or nonblocking) assignment
+ASSIGNMENT_RE = re.compile(r"^\s*(?:assign\s+)?([A-Za-z_][\w.]*)(?:\s*\[[^\]]*\])*\s*<?=(?!=)")
+# the same, at the start of any line of a whole text, within that line
+ASSIGNMENT_LINE_RE = re.compile(
+    r"^[^\S\n]*(?:assign[^\S\n]+)?([A-Za-z_][\w.]*)(?:[^\S\n]*\[[^\]\n]*\])*[^\S\n]*<?=(?!=)", re.M)
+INPUT_RE = re.compile(
+    r"\binput\b(?:\s*(?:wire|reg|logic|signed|unsigned)\b|\s*\[[^\]]*\])*\s*"
+    r"([A-Za-z_]\w*(?:\s*,\s*(?!input\b|output\b|inout\b)[A-Za-z_]\w*)*)"
+)
+WORD_RE = re.compile(r"\b[A-Za-z_]\w*\b")
+# `@(*)`, the one place where an operator character stands alone
+EVENT_STAR_RE = re.compile(r"@\s*\(\s*\*\s*\)")
+
+
+def _block_depths(line):
+    words = WORD_RE.findall(line)
+    return tuple(words.count(start) - words.count(end) for start, end in BLOCKS)
+
+
+def _bracket_depths(line):
+    return tuple(line.count(open_) - line.count(close) for open_, close in BRACKETS)
+
+
+_bytes_patterns = {}
+
+def _pattern(regex, text):
+    # `regex` for bytes when scanning a mapped file
+    if isinstance(text, str):
+        return regex
+    if regex not in _bytes_patterns:
+        _bytes_patterns[regex] = re.compile(regex.pattern.encode(), regex.flags & ~re.UNICODE)
+    return _bytes_patterns[regex]
+
+
+def _names(groups):
+    return {name.decode() if isinstance(name, bytes) else name for name in groups}
+
+
+def input_ports(text):
+    """
+    Return the names declared as inputs in the (comment-masked) text,
+    str or bytes.
+    """
+    sep = "," if isinstance(text, str) else b","
+    return _names(name.strip() for m in _pattern(INPUT_RE, text).finditer(text) for name in m.group(1).split(sep))
+
+
+def assigned_names(text):
+    """
+    Return the names assigned anywhere in the (comment-masked) text,
+    str or bytes.
+    """
+    return _names(m.group(1) for m in _pattern(ASSIGNMENT_LINE_RE, text).finditer(text))
+
+
+class Screener:
+    """
+    Decide whether a mutant is worth verifying.
+    `check` returns None for a plausible mutant, or the reason code of the
+    defect found. With `parse`, mutants passing the lexical checks are also
+    parsed with pyverilog, unless the base source itself does not parse.
+    The base is scanned once, as a whole; mapped lines (MappedLines) are
+    scanned in their mapped bytes, never split into lines.
+    """
+    def __init__(self, base_lines, parse=False):
+        self.base_lines = base_lines
+        data = getattr(base_lines, "data", None)
+        masked = mask_comments(data if data is not None else "".join(base_lines))
+        self.inputs = input_ports(masked)
+        self.assigned = assigned_names(masked)
+        del masked
+        self.parse = parse and self._parses("".join(base_lines))
+        if parse and not self.parse:
+            print("Warning: the source does not parse on its own, mutants are only screened lexically.")
+
+    @staticmethod
+    def _parses(text):
+        from .frontend import parse_text
+        try:
+            parse_text(text)
+        except Exception:
+            return False
+        return True
+
+    def check(self, line_no, original_line, mutated_line):
+        original = EVENT_STAR_RE.sub("@(_)", mask_comments(original_line))
+        mutated = EVENT_STAR_RE.sub("@(_)", mask_comments(mutated_line))
+        if _bracket_depths(mutated) != _bracket_depths(original):
+            return UNBALANCED_BRACKETS
+        if _block_depths(mutated) != _block_depths(original):
+            return UNBALANCED_BLOCKS
+        for regex in MISSING_OPERAND_RES:
+            if len(regex.findall(mutated)) > len(regex.findall(original)):
+                return MISSING_OPERAND
+
+        if len(NEGATED_KEYWORD_RE.findall(mutated)) > len(NEGATED_KEYWORD_RE.findall(original)):
+            return NEGATED_KEYWORD
+
+        original_target = ASSIGNMENT_RE.match(original)
+        mutated_target = ASSIGNMENT_RE.match(mutated)
+        if original_target and not mutated_target:
+            return BROKEN_ASSIGNMENT
+        if mutated_target and mutated_target.group(1) in self.inputs and (
+                not original_target or original_target.group(1) != mutated_target.group(1)):
+            return INPUT_ASSIGNED
+        if (input_ports(mutated) - input_ports(original)) & self.assigned:
+            return INPUT_ASSIGNED
+
+        if self.parse:
+            lines = list(self.base_lines)
+            lines[line_no] = mutated_line
+            if not self._parses("".join(lines)):
+                return PARSE_ERROR
+        return None
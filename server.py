@@ -0,0 +1,111 @@
+# server.py
+# Resident fault injection server.
+#
+# Keeps pyverilog, the parser tables and the code generator loaded in one
+# long-running process and serves injection jobs over a local Unix socket,
+# so clients do not pay the start-up cost on every call.
+#
+# Protocol: the client sends one JSON job per line and receives one JSON
+# response per line.
+#   job:      {"input": "<path>", "config": {<FaultInjConfig fields>},
+#              "output": "<mutant dir, svm only>", "jobs": <svm workers>}
+#   response: {"status": "ok", "verilog": "..."}        (AST perturbations)
+#             {"status": "ok", "metadata": {...},       (svm)
+#              "written": <mutants written>}
+#             {"status": "error", "error": "..."}
+
+import os
+import json
+import socket
+import argparse
+import tempfile
+import socketserver
+
+from .config import FaultInjConfig
+from .frontend import get_parser, get_codegenerator
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "faultinj.sock")
+
+
+def handle_job(job: dict) -> dict:
+    """
+    Run a single injection job and return its response.
+    """
+    from .inject import fault_inject, fault_inject_svm
+
+    config = FaultInjConfig(**job.get("config", {}))
+    if not os.path.isfile(job["input"]):
+        # pyverilog would otherwise take the path for inline Verilog source
+        raise FileNotFoundError(job["input"])
+    if config.svm:
+        if not job.get("output"):
+            raise ValueError("Output directory must be specified when using SmartVerilog mutation module.")
+        os.makedirs(job["output"], exist_ok=True)
+        metadata = fault_inject_svm(job["input"], job["output"], jobs=job.get("jobs", 1),
+                                    seed=config.seed, prune=config.prune_dead_sites, pack=config.pack_mutants,
+                                    large_file=config.large_file, budget=config.mutant_budget,
+                                    quotas=config.category_quotas, engine=config.svm_engine)
+        return {"status": "ok", "metadata": dict(metadata), "written": metadata.kept()}
+    return {"status": "ok", "verilog": fault_inject([job["input"]], config)}
+
+
+class InjectionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for request in self.rfile:
+            if not request.strip():
+                continue
+            try:
+                response = handle_job(json.loads(request))
+            except Exception as e:
+                response = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+def serve(socket_path: str = DEFAULT_SOCKET):
+    """
+    Warm up the parser and code generator, then serve jobs on `socket_path`
+    until interrupted. Jobs are handled one at a time, since the shared
+    parser is not thread-safe.
+    """
+    get_parser()
+    get_codegenerator()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.UnixStreamServer(socket_path, InjectionHandler) as server:
+        print(f"Fault injection server listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def submit(job: dict, socket_path: str = DEFAULT_SOCKET) -> dict:
+    """
+    Send a job to a running server and return its response.
+    Relative paths in the job are resolved against the client's directory.
+    """
+    job = dict(job)
+    for key in ("input", "output"):
+        if job.get(key):
+            job[key] = os.path.abspath(job[key])
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + "\n").encode())
+        with sock.makefile("rb") as stream:
+            response = stream.readline()
+    if not response:
+        raise ConnectionError(f"No response from fault injection server at {socket_path}")
+    return json.loads(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident fault injection server")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    args = parser.parse_args()
+    serve(args.socket)
+
+if __name__ == "__main__":
+    main()
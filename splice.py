@@ -0,0 +1,413 @@
+# splice.py
+# Incremental code generation: splice perturbations into the original source.
+#
+# pyverilog nodes carry a line number but no column, so every edit is located
+# by its ordinal among the nodes of the same kind on its line, matched against
+# the tokens of that kind in the source line. Whenever the two disagree
+# (synthesized nodes, ...) the splice gives up and the caller falls back to
+# regenerating the whole design. Line numbers come from the preprocessed text,
+# so a source using directives that can shift lines or change the tokens of a
+# line (`include, `define, `ifdef, macro uses) is never spliced: counts could
+# still agree on the wrong line.
+
+import re
+from collections import namedtuple
+from pyverilog.vparser.ast import (
+    Node, Assign, IfStatement, IntConst, NonblockingSubstitution, UnaryOperator,
+    Power, Times, Divide, Mod, Plus, Minus, Sll, Srl, Sla, Sra,
+    LessThan, GreaterThan, LessEq, GreaterEq, Eq, NotEq, Eql, NotEql,
+    And, Xor, Xnor, Or, Land, Lor,
+    Uplus, Uminus, Ulnot, Unot, Uand, Unand, Uor, Unor, Uxor, Uxnor,
+)
+
+from .utils import mask_comments
+
+# A perturbation recorded by a Perturber:
+#   negate_rvalue     the RHS of `node` (Assign) was wrapped in Unot
+#   negate_condition  the condition of `node` (IfStatement) was wrapped in Unot
+#   replace_rvalue    the RHS of `node` (Assign) was replaced
+#   constant          the value of `node` (IntConst) was changed from `original`
+#   operator          the class of `node` (an operator) was changed from `original`
+Edit = namedtuple("Edit", ["kind", "node", "original"], defaults=[None])
+
+# the source token of every node type that has one, for locating operators
+OPERATOR_SYMBOLS = {
+    Power: "**", Times: "*", Divide: "/", Mod: "%", Plus: "+", Minus: "-",
+    Sll: "<<", Srl: ">>", Sla: "<<<", Sra: ">>>",
+    LessThan: "<", GreaterThan: ">", LessEq: "<=", GreaterEq: ">=",
+    Eq: "==", NotEq: "!=", Eql: "===", NotEql: "!==",
+    And: "&", Xor: "^", Xnor: "~^", Or: "|", Land: "&&", Lor: "||",
+    Uplus: "+", Uminus: "-", Ulnot: "!", Unot: "~", Uand: "&", Unand: "~&",
+    Uor: "|", Unor: "~|", Uxor: "^", Uxnor: "~^",
+    NonblockingSubstitution: "<=",
+}
+
+# binding strength of the binary operators; a token swapped for one of another
+# level would regroup the operands around it
+PRECEDENCE = {
+    Power: 9, Times: 8, Divide: 8, Mod: 8, Plus: 7, Minus: 7, Sll: 6, Srl: 6, Sla: 6, Sra: 6,
+    LessThan: 5, GreaterThan: 5, LessEq: 5, GreaterEq: 5, Eq: 4, NotEq: 4, Eql: 4, NotEql: 4,
+    And: 3, Xor: 2, Xnor: 2, Or: 1, Land: 0, Lor: -1,
+}
+
+DIRECTIVE_RE = re.compile(r"`(\w+)")
+# directives the preprocessor passes through, one line for one line
+LINE_NEUTRAL_DIRECTIVES = {
+    "timescale", "default_nettype", "resetall", "celldefine", "endcelldefine",
+    "unconnected_drive", "nounconnected_drive",
+}
+
+ASSIGN_EQ_RE = re.compile(r"(?<![=!<>])=(?![=>])")
+IF_RE = re.compile(r"\bif\b")
+# longest first, so that e.g. `<=` or `->` never count as `<` or `-`
+OPERATOR_TOKEN_RE = re.compile(
+    r"===|!==|==|!=|<<<|>>>|<<|>>|<=|>=|&&|\|\||~\^|\^~|~&|~\||\*\*|->|[-+]:|[-+*/%<>&|^!~?:=]"
+)
+# `@*` and `@(*)`, where `*` is no operator
+EVENT_STAR_RE = re.compile(r"@\s*\(\s*\*\s*\)|@\s*\*")
+NUMBER_RE = re.compile(
+    r"(?<![\w$])(?:\d+)?'[sS]?[bBoOdDhH][0-9a-fA-FxXzZ_?]+"
+    r"|(?<![\w$'.])\d+(?![\w'.])"
+)
+
+
+def _expression_end(masked, pos):
+    """
+    Return the end of the expression starting at `pos`: the first `;` or `,`
+    outside any brackets.
+    """
+    depth = 0
+    for i in range(pos, len(masked)):
+        c = masked[i]
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            if depth == 0:
+                return None
+            depth -= 1
+        elif c in ";," and depth == 0:
+            return i
+    return None
+
+
+def _matching_paren(masked, pos):
+    depth = 0
+    for i in range(pos, len(masked)):
+        if masked[i] == "(":
+            depth += 1
+        elif masked[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _trim(masked, start, end):
+    while start < end and masked[start].isspace():
+        start += 1
+    while end > start and masked[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _index_nodes(ast):
+    """
+    Map (node type, lineno) to the nodes of that type on that line, in
+    pre-order (which is source order for the kinds we splice).
+    """
+    index = {}
+    seen = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        # pyverilog shares some subtrees (e.g. the width of an ANSI port)
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, (Assign, IfStatement, IntConst)):
+            index.setdefault((type(node), node.lineno), []).append(node)
+        stack.extend(reversed([c for c in node.children() if isinstance(c, Node)]))
+    return index
+
+
+def _index_operators(ast, originals, parents):
+    """
+    Map (symbol, lineno) to the nodes with that token on that line, in source
+    order: an in-order walk, where a unary operator comes before its operand
+    and any other operator (or `<=` assignment) after its first operand.
+    `originals` maps the ids of mutated operators to their original class;
+    the parent of every node is recorded in `parents`, by id.
+    """
+    index = {}
+    seen = set()
+    stack = [(ast, False)]
+    while stack:
+        node, emit = stack.pop()
+        if emit:
+            symbol = OPERATOR_SYMBOLS[originals.get(id(node), type(node))]
+            index.setdefault((symbol, node.lineno), []).append(node)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        children = [(c, False) for c in node.children() if isinstance(c, Node)]
+        for child, _ in children:
+            parents.setdefault(id(child), node)
+        cls = originals.get(id(node), type(node))
+        if cls in OPERATOR_SYMBOLS:
+            if issubclass(cls, UnaryOperator):
+                children.insert(0, (node, True))
+            elif children:
+                children.insert(1, (node, True))
+        stack.extend(reversed(children))
+    return index
+
+
+def _keeps_grouping(node, parent):
+    """
+    Whether the text of binary operator `node`, with its current token, still
+    groups its operands (and sits in its parent) as in the AST. Parentheses
+    are not seen, so the answer errs on the side of False.
+    """
+    level = PRECEDENCE[type(node)]
+    # operators are left-associative: a left operand may bind as loosely
+    if PRECEDENCE.get(type(node.left), level + 1) < level:
+        return False
+    if PRECEDENCE.get(type(node.right), level + 1) <= level:
+        return False
+    if type(parent) in PRECEDENCE:
+        outer = PRECEDENCE[type(parent)]
+        return level >= outer if node is parent.left else level > outer
+    return True
+
+
+class _Source:
+    def __init__(self, text):
+        self.text = text
+        self.masked = mask_comments(text)
+        self.line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+        # whether the preprocessor may have moved lines or tokens
+        self.preprocessed = any(m.group(1) not in LINE_NEUTRAL_DIRECTIVES
+                                for m in DIRECTIVE_RE.finditer(self.masked))
+
+    def line_span(self, lineno):
+        if not 1 <= lineno <= len(self.line_starts):
+            return None
+        start = self.line_starts[lineno - 1]
+        end = self.line_starts[lineno] if lineno < len(self.line_starts) else len(self.text)
+        return start, end
+
+    def find(self, regex, lineno):
+        span = self.line_span(lineno)
+        if span is None:
+            return []
+        return [m for m in regex.finditer(self.masked, span[0], span[1])]
+
+    def operator_tokens(self, symbol, lineno):
+        """
+        Return the (start, end) spans of the operator tokens `symbol` on a line.
+        """
+        span = self.line_span(lineno)
+        if span is None:
+            return []
+        line = EVENT_STAR_RE.sub(lambda m: " " * len(m.group(0)), self.masked[span[0]:span[1]])
+        return [(span[0] + m.start(), span[0] + m.end()) for m in OPERATOR_TOKEN_RE.finditer(line)
+                if m.group(0).replace("^~", "~^") == symbol]
+
+
+def _ordinal_match(source, index, node, regex):
+    """
+    Return the token on the node's line that corresponds to the node, or None
+    if the nodes and tokens on that line do not pair up one to one.
+    """
+    nodes = index.get((type(node), node.lineno), [])
+    tokens = source.find(regex, node.lineno)
+    if len(nodes) != len(tokens):
+        return None
+    for candidate, token in zip(nodes, tokens):
+        if candidate is node:
+            return token
+    return None
+
+
+def _rvalue_span(source, index, node):
+    eq = _ordinal_match(source, index, node, ASSIGN_EQ_RE)
+    if eq is None:
+        return None
+    end = _expression_end(source.masked, eq.end())
+    if end is None:
+        return None
+    return _trim(source.masked, eq.end(), end)
+
+
+def _condition_span(source, index, node):
+    token = _ordinal_match(source, index, node, IF_RE)
+    if token is None:
+        return None
+    start, _ = _trim(source.masked, token.end(), len(source.masked))
+    if start >= len(source.masked) or source.masked[start] != "(":
+        return None
+    end = _matching_paren(source.masked, start)
+    if end is None:
+        return None
+    return _trim(source.masked, start + 1, end)
+
+
+def _constant_regions(source, index, edits, replaced):
+    """
+    Locate the tokens of changed constants, skipping those inside regions
+    that are regenerated anyway.
+    """
+    # a node visited twice is edited twice; what counts is its net change
+    originals = {}
+    for edit in edits:
+        originals.setdefault(id(edit.node), edit.original)
+    edits = [edit for edit in edits if originals[id(edit.node)] != edit.node.value]
+    changed = {id(edit.node): originals[id(edit.node)] for edit in edits}
+
+    def original(n):
+        return changed.get(id(n), n.value)
+
+    regions = []
+    for lineno in sorted({edit.node.lineno for edit in edits}):
+        nodes = index.get((IntConst, lineno), [])
+        tokens = [m for m in source.find(NUMBER_RE, lineno)
+                  if not any(start <= m.start() < end for start, end in replaced)]
+        for value in {changed[id(edit.node)] for edit in edits if edit.node.lineno == lineno}:
+            same = [n for n in nodes if original(n) == value]
+            matches = [m for m in tokens if m.group(0) == value]
+            if len(same) == len(matches):
+                pairs = zip(same, matches)
+            elif same and all(id(n) in changed for n in same) and len({n.value for n in same}) == 1:
+                # duplicated or synthesized nodes (e.g. port widths): every
+                # occurrence of the value changed the same way
+                pairs = ((same[0], m) for m in matches)
+            else:
+                return None
+            for n, m in pairs:
+                if id(n) in changed:
+                    regions.append((m.start(), m.end(), n.value))
+    return regions
+
+
+class Splicer:
+    """
+    Splice edits into one source text, repeatedly.
+    The comment-masked source and the node index are built once, from the
+    unperturbed AST, so that each variant only pays for locating its own
+    edits (see SiteIndex in perturbations.py).
+    """
+    def __init__(self, source_text: str, ast):
+        self.ast = ast
+        self.source = _Source(source_text)
+        self.index = _index_nodes(ast)
+        self.reachable = {id(n) for nodes in self.index.values() for n in nodes}
+        # operator nodes and the parent of every node, indexed on first use
+        self.operators = None
+        self.parents = None
+
+    def _operator_span(self, edit, edits):
+        if self.operators is None:
+            # the AST may already carry the edits; index operators by their
+            # original token (a node visited twice is edited twice)
+            originals = {}
+            for e in edits:
+                if e.kind == "operator":
+                    originals.setdefault(id(e.node), e.original)
+            self.parents = {}
+            self.operators = _index_operators(self.ast, originals, self.parents)
+        symbol = OPERATOR_SYMBOLS[edit.original]
+        nodes = self.operators.get((symbol, edit.node.lineno), [])
+        tokens = self.source.operator_tokens(symbol, edit.node.lineno)
+        if len(nodes) != len(tokens):
+            return None
+        for candidate, token in zip(nodes, tokens):
+            if candidate is edit.node:
+                # a token of another precedence level may regroup the operands
+                if (PRECEDENCE.get(edit.original) != PRECEDENCE.get(type(edit.node))
+                        and not _keeps_grouping(edit.node, self.parents.get(id(edit.node)))):
+                    return None
+                return token
+        return None
+
+    def regions(self, edits, codegenerator):
+        """
+        Return the (start, end, text) replacements of the source text that
+        apply the recorded edits, in source order, or None if some edit
+        cannot be located reliably.
+        """
+        source, index = self.source, self.index
+        if source.preprocessed:
+            return None
+        edits = [edit for edit in edits if id(edit.node) in self.reachable or edit.kind == "operator"]
+
+        regions = []     # (start, end, text); insertions have start == end
+        replaced = []    # spans regenerated as a whole
+        seen = set()
+        for edit in edits:
+            if edit.kind == "constant" or (edit.kind, id(edit.node)) in seen:
+                continue
+            seen.add((edit.kind, id(edit.node)))
+            if edit.kind == "operator":
+                # the first edit of a node holds its original class
+                span = self._operator_span(edit, edits)
+                if span is None:
+                    return None
+                regions.append((span[0], span[1], OPERATOR_SYMBOLS[type(edit.node)]))
+                continue
+            if edit.kind == "negate_condition":
+                span = _condition_span(source, index, edit.node)
+            else:
+                span = _rvalue_span(source, index, edit.node)
+            if span is None:
+                return None
+            start, end = span
+            if edit.kind == "replace_rvalue":
+                regions.append((start, end, codegenerator.visit(edit.node.right)))
+                replaced.append((start, end))
+            else:
+                regions.append((start, start, "~("))
+                regions.append((end, end, ")"))
+
+        constants = _constant_regions(source, index, [e for e in edits if e.kind == "constant"], replaced)
+        if constants is None:
+            return None
+        regions.extend(constants)
+
+        # a regenerated region already reflects every edit inside it
+        regions = [r for r in regions
+                   if (r[0], r[1]) in replaced or not any(start <= r[0] and r[1] <= end for start, end in replaced)]
+        regions.sort(key=lambda r: (r[0], r[1]))
+        pos = 0
+        for start, end, text in regions:
+            if start < pos:
+                return None
+            pos = end
+        return regions
+
+    def splice(self, edits, codegenerator):
+        """
+        Apply the recorded edits to the source text and return the perturbed
+        text, or None if some edit cannot be located reliably.
+        """
+        regions = self.regions(edits, codegenerator)
+        if regions is None:
+            return None
+        source_text = self.source.text
+        parts = []
+        pos = 0
+        for start, end, text in regions:
+            parts.append(source_text[pos:start])
+            parts.append(text)
+            pos = end
+        parts.append(source_text[pos:])
+        return "".join(parts)
+
+
+def splice_edits(source_text: str, ast, edits, codegenerator):
+    """
+    Apply the recorded edits to the original source text and return the
+    perturbed text, or None if some edit cannot be located reliably.
+    Unchanged code, formatting and comments are kept verbatim.
+    """
+    return Splicer(source_text, ast).splice(edits, codegenerator)
@@ -0,0 +1,379 @@
+# store.py
+# Patch-based storage for generated mutants.
+#
+# A mutant differs from its source in a single line, so instead of keeping a
+# full copy per mutant the store keeps the base source once and a compact
+# (line, byte range, replacement) patch per mutant.
+#
+# The store can also be written as a single pack file (base source, patch
+# index and replacements in one archive), which MutantPack maps to extract
+# any mutant by id without touching the rest.
+#
+# For huge inputs the base can be the memory-mapped source file itself
+# (MappedLines); mutants are then written with kernel range copies from that
+# file around the replaced span, never passing the source through Python.
+
+import os
+import re
+import json
+import mmap
+import struct
+import bisect
+from array import array
+from collections.abc import Sequence
+
+HEADER = struct.Struct("<Q")
+ALIGN = 8
+
+
+def write_sections(path, magic, header, sections):
+    """
+    Write a binary file of named sections: `magic`, the length of the JSON
+    header, the header (`header` plus the position of every section), then
+    the sections themselves, each aligned to 8 bytes.
+    """
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        nbytes = memoryview(data).nbytes
+        layout[name] = [offset, nbytes]
+        offset += nbytes + (-nbytes % ALIGN)
+    encoded = json.dumps(dict(header, sections=layout)).encode()
+    encoded += b" " * (-(len(magic) + HEADER.size + len(encoded)) % ALIGN)
+
+    with open(path, "wb") as f:
+        f.write(magic)
+        f.write(HEADER.pack(len(encoded)))
+        f.write(encoded)
+        for name, data in sections:
+            f.write(data)
+            f.write(b"\0" * (-memoryview(data).nbytes % ALIGN))
+
+
+def map_sections(path, magic):
+    """
+    Map a file written by `write_sections` and return (mmap, header,
+    sections), the sections as memoryviews into the mapped file.
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    if view[:len(magic)] != magic:
+        raise ValueError(f"{path} is not a {magic.strip().decode()} file")
+    (header_size,) = HEADER.unpack_from(view, len(magic))
+    base = len(magic) + HEADER.size
+    header = json.loads(bytes(view[base:base + header_size]))
+    base += header_size
+    sections = {name: view[base + start:base + start + nbytes]
+                for name, (start, nbytes) in header["sections"].items()}
+    return data, header, sections
+
+
+def line_offsets(data):
+    """
+    Return the byte offset of the start of every line of `data`, plus its end.
+    """
+    offsets = array("Q", [0])
+    find = data.find
+    pos = find(b"\n")
+    while pos >= 0:
+        offsets.append(pos + 1)
+        pos = find(b"\n", pos + 1)
+    if offsets[-1] != len(data):
+        offsets.append(len(data))
+    return offsets
+
+
+class MappedLines(Sequence):
+    """
+    The lines of a file, memory-mapped. The byte offset of every line is
+    indexed once; lines are decoded only when accessed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file cannot be mapped
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets = line_offsets(self.data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, line_no):
+        if isinstance(line_no, slice):
+            return [self[i] for i in range(*line_no.indices(len(self)))]
+        if line_no < 0:
+            line_no += len(self)
+        if not 0 <= line_no < len(self):
+            raise IndexError(line_no)
+        return self.data[self.offsets[line_no]:self.offsets[line_no + 1]].decode()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+def copy_range(src_fd, dst_fd, offset, count):
+    """
+    Append bytes [offset, offset + count) of file `src_fd` to file `dst_fd`
+    in the kernel, with copy_file_range or sendfile. Returns the number of
+    bytes that could not be copied that way (0 on success).
+    """
+    while count > 0:
+        try:
+            if hasattr(os, "copy_file_range"):
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset)
+            else:
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError:
+            # e.g. not supported across these filesystems
+            return count
+        if copied == 0:
+            return count
+        offset += copied
+        count -= copied
+    return 0
+
+
+class MutantStore:
+    """
+    One base source plus an index of patches, keyed by mutant id.
+    A patch (line_no, start, end, replacement) replaces bytes [start, end) of
+    line `line_no` (0-based) with `replacement`. Mutants are materialized on
+    demand, either as a string or straight to a file.
+    Given MappedLines, the mapped file is the base and no copy is made.
+    """
+    BASE_NAME = "base.sv"
+    INDEX_NAME = "patches.jsonl"
+    PACK_NAME = "mutants.pack"
+
+    def __init__(self, base_lines):
+        self.source = None
+        self.patches = {}
+        if isinstance(base_lines, MappedLines):
+            self.source = base_lines
+            self.base = base_lines.data
+            self.line_offsets = base_lines.offsets
+            return
+        encoded = [line.encode() for line in base_lines]
+        self.base = b"".join(encoded)
+        # byte offset of the start of every line, plus the end of the file
+        self.line_offsets = array("Q", [0])
+        for line in encoded:
+            self.line_offsets.append(self.line_offsets[-1] + len(line))
+
+    def __len__(self):
+        return len(self.patches)
+
+    def __contains__(self, mutant_id):
+        return mutant_id in self.patches
+
+    def line(self, line_no):
+        """
+        Return the base text of a line (0-based).
+        """
+        start, end = self.line_offsets[line_no], self.line_offsets[line_no + 1]
+        return self.base[start:end].decode()
+
+    def add(self, mutant_id, line_no, original_line, mutated_line):
+        """
+        Record a mutant as the minimal byte range of `original_line` that
+        differs in `mutated_line`.
+        """
+        original = original_line.encode()
+        mutated = mutated_line.encode()
+        prefix = len(os.path.commonprefix([original, mutated]))
+        limit = min(len(original), len(mutated)) - prefix
+        suffix = 0
+        while suffix < limit and original[-1 - suffix] == mutated[-1 - suffix]:
+            suffix += 1
+        self.patches[mutant_id] = (line_no, prefix, len(original) - suffix, mutated[prefix:len(mutated) - suffix])
+
+    def discard(self, mutant_id):
+        """
+        Remove a mutant from the store, if present.
+        """
+        self.patches.pop(mutant_id, None)
+
+    def _span(self, mutant_id):
+        line_no, start, end, replacement = self.patches[mutant_id]
+        offset = self.line_offsets[line_no]
+        return offset + start, offset + end, replacement
+
+    def materialize(self, mutant_id) -> str:
+        """
+        Return the full text of a mutant.
+        """
+        start, end, replacement = self._span(mutant_id)
+        return (self.base[:start] + replacement + self.base[end:]).decode()
+
+    def write(self, mutant_id, path, header=""):
+        """
+        Write a mutant to `path`, optionally prefixed with a header comment.
+        """
+        start, end, replacement = self._span(mutant_id)
+        view = memoryview(self.base)
+        if self.source is not None:
+            # unbuffered, so the kernel copies land in order with the writes
+            with open(path, "wb", buffering=0) as file:
+                if header:
+                    file.write(header.encode())
+                for offset, stop in ((0, start), (end, len(view))):
+                    left = copy_range(self.source.fileno(), file.fileno(), offset, stop - offset)
+                    if left:
+                        file.write(view[stop - left:stop])
+                    if offset == 0:
+                        file.write(replacement)
+            return
+        with open(path, "wb") as file:
+            if header:
+                file.write(header.encode())
+            file.write(view[:start])
+            file.write(replacement)
+            file.write(view[end:])
+
+    def save(self, directory):
+        """
+        Write the base source and the patch index to `directory`.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, self.BASE_NAME), "wb") as file:
+            file.write(self.base)
+        with open(os.path.join(directory, self.INDEX_NAME), "w") as file:
+            for mutant_id, (line_no, start, end, replacement) in self.patches.items():
+                file.write(json.dumps({
+                    "id": mutant_id,
+                    "line": line_no,
+                    "start": start,
+                    "end": end,
+                    "replacement": replacement.decode(errors="surrogateescape"),
+                }) + "\n")
+
+    def save_pack(self, path):
+        """
+        Write the store as a single pack file (a directory gets PACK_NAME in
+        it); see MutantPack.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, self.PACK_NAME)
+        ids, starts, ends, offsets = array("Q"), array("Q"), array("Q"), array("Q", [0])
+        replacements = bytearray()
+        for mutant_id in sorted(self.patches):
+            start, end, replacement = self._span(mutant_id)
+            ids.append(mutant_id)
+            starts.append(start)
+            ends.append(end)
+            replacements += replacement
+            offsets.append(len(replacements))
+        write_sections(path, MutantPack.MAGIC, {"count": len(ids)}, [
+            ("ids", ids), ("starts", starts), ("ends", ends),
+            ("replacement_offsets", offsets), ("base", self.base), ("replacements", replacements),
+        ])
+        return path
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load a store previously written with `save`.
+        """
+        with open(os.path.join(directory, cls.BASE_NAME), "rb") as file:
+            base_lines = [line.decode() for line in file.readlines()]
+        store = cls(base_lines)
+        with open(os.path.join(directory, cls.INDEX_NAME), "r") as file:
+            for entry in file:
+                patch = json.loads(entry)
+                store.patches[patch["id"]] = (
+                    patch["line"],
+                    patch["start"],
+                    patch["end"],
+                    patch["replacement"].encode(errors="surrogateescape"),
+                )
+        return store
+
+
+class MutantPack:
+    """
+    Read-only view of a pack file written by `MutantStore.save_pack`.
+    The file is mapped, so opening a pack costs the same for any number of
+    mutants: a mutant is found by binary search in the (sorted) mapped id
+    column and assembled from its patch on demand. Mutants
+    are also addressable by their file name in a directory of mutants,
+    `mutant_<id>.sv`.
+    """
+    MAGIC = b"FIMPACK1"
+    NAME_RE = re.compile(r"^mutant_(\d+)\.sv$")
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, MutantStore.PACK_NAME)
+        self.path = path
+        self._mmap, header, sections = map_sections(path, self.MAGIC)
+        self.ids = sections["ids"].cast("Q")
+        self.starts = sections["starts"].cast("Q")
+        self.ends = sections["ends"].cast("Q")
+        self.replacement_offsets = sections["replacement_offsets"].cast("Q")
+        self.base = sections["base"]
+        self.replacements = sections["replacements"]
+
+    def _row(self, mutant_id):
+        # save_pack writes the ids sorted
+        row = bisect.bisect_left(self.ids, mutant_id)
+        if row == len(self.ids) or self.ids[row] != mutant_id:
+            return None
+        return row
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, mutant_id):
+        return self._row(mutant_id) is not None
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    @staticmethod
+    def member_name(mutant_id):
+        return f"mutant_{mutant_id}.sv"
+
+    @classmethod
+    def mutant_id(cls, name):
+        """
+        Return the id of a mutant from its file name (or path), or None.
+        """
+        m = cls.NAME_RE.match(os.path.basename(name))
+        return int(m.group(1)) if m else None
+
+    def names(self):
+        return [self.member_name(mutant_id) for mutant_id in self.ids]
+
+    def _parts(self, mutant_id):
+        row = self._row(mutant_id)
+        if row is None:
+            raise KeyError(mutant_id)
+        start, end = self.starts[row], self.ends[row]
+        replacement = self.replacements[self.replacement_offsets[row]:self.replacement_offsets[row + 1]]
+        return self.base[:start], replacement, self.base[end:]
+
+    def read(self, mutant_id) -> bytes:
+        """
+        Return the full text of a mutant, as bytes.
+        """
+        return b"".join(self._parts(mutant_id))
+
+    def materialize(self, mutant_id) -> str:
+        return self.read(mutant_id).decode()
+
+    def write(self, mutant_id, path, header=""):
+        """
+        Write a mutant to `path`, optionally prefixed with a header comment.
+        """
+        with open(path, "wb") as file:
+            if header:
+                file.write(header.encode())
+            for part in self._parts(mutant_id):
+                file.write(part)
@@ -0,0 +1,265 @@
+# table.py
+# Columnar storage for SmartVerilog mutant metadata.
+#
+# A metadata record repeats the full original and mutated line, the category
+# and the match list of its mutant. The table keeps the source once and
+# stores every record as a row of array-backed columns: the line index into
+# that source, interned category, match list and screen reason, and the byte
+# range of the line the mutant replaces. Records are rebuilt on access, with
+# the same schema as the dicts of `SmartVerilogMutation.iter_mutants`.
+#
+# On disk the table is one binary file: a JSON header (interned strings and
+# the position of every section) followed by the raw columns. `load` maps the
+# file and reads the columns in place, so only the records accessed are ever
+# decoded.
+
+import os
+import json
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from .store import MappedLines, write_sections, map_sections
+
+MAGIC = b"FIMTABL1"
+
+# column name -> array typecode
+COLUMNS = {
+    "ids": "Q",
+    "lines": "I",
+    "categories": "H",
+    "matches": "I",
+    "digests": "Q",
+    "duplicate_of": "q",  # -1: not a duplicate
+    "screen": "H",        # 0: passed the screen, else 1 + reason index
+    "live": "b",          # -1: not analyzed
+    "sampled": "b",       # -1: not a sampling candidate
+    "starts": "I",
+    "ends": "I",
+    "replacement_offsets": "Q",
+    "line_offsets": "Q",
+}
+
+
+class _Interned:
+    """
+    Strings stored once, referred to by their index.
+    """
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.index = {value: i for i, value in enumerate(self.values)}
+
+    def intern(self, value):
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+def _line_patch(original, mutated):
+    """
+    Return (start, end, replacement): the minimal byte range of `original`
+    that `mutated` replaces.
+    """
+    prefix = len(os.path.commonprefix([original, mutated]))
+    limit = min(len(original), len(mutated)) - prefix
+    suffix = 0
+    while suffix < limit and original[-1 - suffix] == mutated[-1 - suffix]:
+        suffix += 1
+    return prefix, len(original) - suffix, mutated[prefix:len(mutated) - suffix]
+
+
+def _decode_match(text):
+    """
+    Decode a stored match list: its group tuples come back from JSON as
+    lists.
+    """
+    return [tuple(value) if isinstance(value, list) else value for value in json.loads(text)]
+
+
+class MutantTable(Mapping):
+    """
+    Mutant metadata records keyed by mutation id, in generation order.
+    Build it with `add` (ids must increase), or `load` a saved table.
+    The verdict fields of a record (`screen`, `live`, `sampled`) can be
+    changed after it was added, with `update`.
+    """
+    FILE_NAME = "metadata.bin"
+
+    def __init__(self, base_lines):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        if isinstance(base_lines, MappedLines):
+            # share the mapped source and its line index
+            self.source = base_lines.data
+            self.columns["line_offsets"] = base_lines.offsets
+        else:
+            encoded = [line.encode() for line in base_lines]
+            self.source = b"".join(encoded)
+            offsets = self.columns["line_offsets"]
+            offsets.append(0)
+            for line in encoded:
+                offsets.append(offsets[-1] + len(line))
+        self.columns["replacement_offsets"].append(0)
+        self.replacements = bytearray()
+        self.categories = _Interned()
+        self.matches = _Interned()
+        self.reasons = _Interned()
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.columns["ids"])
+
+    def __iter__(self):
+        return iter(self.columns["ids"])
+
+    def _row(self, mutation_id):
+        ids = self.columns["ids"]
+        row = bisect_left(ids, mutation_id)
+        if row == len(ids) or ids[row] != mutation_id:
+            raise KeyError(mutation_id)
+        return row
+
+    def __contains__(self, mutation_id):
+        try:
+            self._row(mutation_id)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def _line(self, line_no):
+        offsets = self.columns["line_offsets"]
+        return bytes(self.source[offsets[line_no]:offsets[line_no + 1]])
+
+    def _original(self, line_no):
+        # stripped as text, like the records: bytes.strip keeps non-ASCII
+        # whitespace (e.g. a no-break space) that str.strip removes
+        return self._line(line_no).decode().strip().encode()
+
+    def add(self, meta_info):
+        """
+        Append a metadata record, as yielded by `iter_mutants`.
+        """
+        columns = self.columns
+        line_no = meta_info["line"] - 1
+        original = self._original(line_no)
+        mutated = meta_info["mutated_line"].encode()
+        start, end, replacement = _line_patch(original, mutated)
+        digest = meta_info["digest"]
+        columns["ids"].append(meta_info["mutation_id"])
+        columns["lines"].append(line_no)
+        columns["categories"].append(self.categories.intern(meta_info["category"]))
+        columns["matches"].append(self.matches.intern(json.dumps(meta_info["match"])))
+        columns["digests"].append(int(digest, 16) if digest is not None else 0)
+        duplicate_of = meta_info["duplicate_of"]
+        columns["duplicate_of"].append(-1 if duplicate_of is None else duplicate_of)
+        columns["screen"].append(self._encode("screen", meta_info["screen"]))
+        columns["live"].append(self._encode("live", meta_info["live"]))
+        columns["sampled"].append(self._encode("sampled", meta_info.get("sampled")))
+        columns["starts"].append(start)
+        columns["ends"].append(end)
+        self.replacements += replacement
+        columns["replacement_offsets"].append(len(self.replacements))
+
+    def _encode(self, field, value):
+        if field == "screen":
+            return 0 if value is None else 1 + self.reasons.intern(value)
+        return -1 if value is None else int(value)
+
+    def update(self, mutation_id, **fields):
+        """
+        Change the `screen`, `live` or `sampled` field of a record.
+        """
+        row = self._row(mutation_id)
+        for field, value in fields.items():
+            if field not in ("screen", "live", "sampled"):
+                raise KeyError(field)
+            self.columns[field][row] = self._encode(field, value)
+
+    def __getitem__(self, mutation_id):
+        return self.record(self._row(mutation_id))
+
+    def record(self, row):
+        """
+        Rebuild the metadata record of the mutant in (0-based) row `row`.
+        """
+        columns = self.columns
+        line_no = columns["lines"][row]
+        original = self._original(line_no)
+        replacement = self.replacements[columns["replacement_offsets"][row]:columns["replacement_offsets"][row + 1]]
+        mutated = original[:columns["starts"][row]] + bytes(replacement) + original[columns["ends"][row]:]
+        duplicate_of = columns["duplicate_of"][row]
+        screen = columns["screen"][row]
+        live = columns["live"][row]
+        sampled = columns["sampled"][row]
+        return {
+            "mutation_id": columns["ids"][row],
+            "category": self.categories.values[columns["categories"][row]],
+            "line": line_no + 1,
+            "match": _decode_match(self.matches.values[columns["matches"][row]]),
+            "original_line": original.decode(),
+            "mutated_line": mutated.decode(),
+            "digest": f"{columns['digests'][row]:016x}",
+            "duplicate_of": None if duplicate_of < 0 else duplicate_of,
+            "screen": None if screen == 0 else self.reasons.values[screen - 1],
+            "live": None if live < 0 else bool(live),
+            "sampled": None if sampled < 0 else bool(sampled),
+        }
+
+    def kept(self):
+        """
+        Return the number of mutants stored (and written): those neither
+        duplicates, rejected, pruned nor left out of the sample.
+        """
+        columns = self.columns
+        return sum(1 for duplicate_of, screen, live, sampled
+                   in zip(columns["duplicate_of"], columns["screen"], columns["live"], columns["sampled"])
+                   if duplicate_of < 0 and screen == 0 and live != 0 and sampled != 0)
+
+    def records(self):
+        """
+        Yield every record in row order.
+        """
+        for row in range(len(self)):
+            yield self.record(row)
+
+    def nbytes(self):
+        """
+        Return the size of the table's data in bytes.
+        """
+        return (len(self.source) + len(self.replacements)
+                + sum(len(column) * column.itemsize for column in self.columns.values()))
+
+    def save(self, path):
+        """
+        Write the table to `path` (a directory gets FILE_NAME in it).
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, self.FILE_NAME)
+        header = {
+            "count": len(self),
+            "categories": self.categories.values,
+            "matches": self.matches.values,
+            "reasons": self.reasons.values,
+        }
+        sections = list(self.columns.items()) + [("source", self.source), ("replacements", self.replacements)]
+        write_sections(path, MAGIC, header, sections)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a table written by `save`. The columns are read from the mapped
+        file on access; the table is read-only.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, cls.FILE_NAME)
+        table = cls.__new__(cls)
+        table._mmap, header, sections = map_sections(path, MAGIC)
+        table.columns = {name: sections[name].cast(typecode) for name, typecode in COLUMNS.items()}
+        table.source = sections["source"]
+        table.replacements = sections["replacements"]
+        table.categories = _Interned(header["categories"])
+        table.matches = _Interned(header["matches"])
+        table.reasons = _Interned(header["reasons"])
+        return table
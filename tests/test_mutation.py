@@ -0,0 +1,30 @@
+# test_mutation.py
+# SmartVerilogMutation.iter_mutants on examples/fifo.v.
+
+import os
+import json
+
+from ..mutation import SmartVerilogMutation
+from ..table import MutantTable
+
+FIFO = os.path.join(os.path.dirname(__file__), os.pardir, "examples", "fifo.v")
+
+
+def mutant_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("mutant_"))
+
+
+def test_records_without_keeping_them(tmp_path):
+    kept = SmartVerilogMutation(FIFO, str(tmp_path / "kept"), seed=1)
+    records = [json.loads(json.dumps(record)) for record in kept.iter_mutants()]
+
+    streamed = SmartVerilogMutation(FIFO, str(tmp_path / "streamed"), seed=1, keep_records=False)
+    sink = tmp_path / "metadata.jsonl"
+    assert [json.loads(json.dumps(record)) for record in streamed.iter_mutants(str(sink))] == records
+    assert [json.loads(line) for line in sink.read_text().splitlines()] == records
+
+    # the same mutants are written, but nothing is kept in memory or saved
+    assert mutant_files(tmp_path / "streamed") == mutant_files(tmp_path / "kept")
+    assert streamed.kept == kept.kept == len(kept.store) == kept.table.kept() < len(kept.table)
+    assert len(streamed.store) == 0 and not streamed.duplicates and not streamed.rejected
+    assert not os.path.exists(tmp_path / "streamed" / MutantTable.FILE_NAME)
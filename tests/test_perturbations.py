@@ -0,0 +1,104 @@
+# test_perturbations.py
+# SiteIndex.combinations, lazy and sampled; pruning in CompositePerturber.
+
+import os
+import math
+import random
+import itertools
+
+import pytest
+
+from ..config import FaultInjConfig
+from ..frontend import parse_text, get_codegenerator
+from ..perturbations import CompositePerturber, SiteIndex
+from ..prune import ConeOfInfluence
+
+DESIGN = """module top(input a, input b, input c, output y, output z);
+assign y = (a & b) | c;
+assign z = a ^ (b + c);
+endmodule
+"""
+
+DEAD = """module top(input a, input b, output y);
+wire d;
+assign d = a & b;
+assign y = a | b;
+endmodule
+"""
+
+CONFIG = FaultInjConfig(seed=1, invert_logic=True, change_constants=True, mutate_operators=True)
+
+
+@pytest.fixture(scope="module")
+def parse(tmp_path_factory):
+    # pyverilog writes its parser tables to the working directory
+    directory = tmp_path_factory.mktemp("parser")
+
+    def parse(text):
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            return parse_text(text)[0]
+        finally:
+            os.chdir(cwd)
+    return parse
+
+
+@pytest.fixture(scope="module")
+def index(parse):
+    ast = parse(DESIGN)
+    index = SiteIndex(ast, CompositePerturber.from_config(CONFIG).perturbers)
+    assert len(index) >= 4
+    return index
+
+
+def test_lazy_in_lexicographic_order(index):
+    sites = list(index)
+    assert list(index.combinations(2)) == list(itertools.combinations(sites, 2))
+    assert list(index.combinations(2, limit=3)) == list(itertools.combinations(sites, 2))[:3]
+    # nothing is enumerated up front, even for a huge space
+    huge = index.combinations(5, pool=range(10 ** 6))
+    assert next(huge) == (0, 1, 2, 3, 4)
+
+
+def test_sampled_covers_every_combination_once(index):
+    sites = list(index)
+    drawn = list(index.combinations(3, rng=random.Random(7)))
+    assert len(drawn) == math.comb(len(sites), 3)
+    assert set(drawn) == set(itertools.combinations(sites, 3))
+    assert drawn != list(itertools.combinations(sites, 3))
+
+
+def test_sampled_is_reproducible(index):
+    first = list(index.combinations(2, rng=random.Random(3), limit=5))
+    assert first == list(index.combinations(2, rng=random.Random(3), limit=5))
+    assert len(first) == 5
+    assert first != list(index.combinations(2, rng=random.Random(4), limit=5))
+
+
+def test_sampled_without_limit_over_a_large_pool(index):
+    # drawing the whole space costs the same per combination to the end
+    pool = range(300)
+    drawn = list(index.combinations(2, pool=pool, rng=random.Random(1)))
+    assert len(drawn) == len(set(drawn)) == math.comb(300, 2)
+    assert all(a < b for a, b in drawn)
+
+
+def test_sampled_edge_cases(index):
+    assert list(index.combinations(3, pool=range(2), rng=random.Random(1))) == []
+    assert list(index.combinations(0, pool=range(4), rng=random.Random(1))) == [()]
+    assert list(index.combinations(1, pool=["a"], rng=random.Random(1))) == [("a",)]
+
+
+def test_sweep_leaves_dead_sites_alone(parse):
+    ast = parse(DEAD)
+    composite = CompositePerturber.from_config(CONFIG)
+    composite.apply(ast, ConeOfInfluence(ast))
+    verilog = get_codegenerator().visit(ast)
+    assert "assign d = a & b;" in verilog
+    assert "assign y = a | b;" not in verilog
+    # the same sites as pruned from the index
+    pristine = parse(DEAD)
+    index = SiteIndex(pristine, CompositePerturber.from_config(CONFIG).perturbers)
+    cone = ConeOfInfluence(pristine)
+    assert composite.pruned == sum(1 for site in index if not cone.is_live_site(index, site)) > 0
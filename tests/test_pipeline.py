@@ -0,0 +1,87 @@
+# test_pipeline.py
+# CampaignPipeline on examples/fifo.v against a stub ebmc script.
+
+import os
+import stat
+
+import pytest
+
+from ..mutation import SmartVerilogMutation
+from ..pipeline import CampaignPipeline
+from ..screen import PARSE_ERROR
+from ..store import MutantPack
+from ..table import MutantTable
+
+FIFO = os.path.join(os.path.dirname(__file__), os.pardir, "examples", "fifo.v")
+
+STUB = """#!/bin/sh
+# stub ebmc: logs every run, then passes after a short while
+echo "$1" >> {log}
+exec sleep 0.05
+"""
+
+
+@pytest.fixture
+def stub(tmp_path):
+    log = tmp_path / "ebmc.log"
+    path = tmp_path / "ebmc"
+    path.write_text(STUB.format(log=log))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path), log
+
+
+def watch_generation(tool, pipeline):
+    """
+    Record the pipeline's progress each time the tool generates a mutant.
+    """
+    snapshots = []
+    iter_mutants = tool.iter_mutants
+
+    def watched():
+        for meta_info in iter_mutants():
+            snapshots.append(pipeline.progress())
+            yield meta_info
+    tool.iter_mutants = watched
+    return snapshots
+
+
+def test_verification_overlaps_generation(tmp_path, stub):
+    ebmc, log = stub
+    jobs, queue_size = 2, 2
+    tool = SmartVerilogMutation(FIFO, str(tmp_path / "mutants"), seed=1)
+    pipeline = CampaignPipeline(tool, "fifo", jobs=jobs, ebmc_path=ebmc, queue_size=queue_size)
+    snapshots = watch_generation(tool, pipeline)
+    results = list(pipeline.run())
+
+    assert len(results) == len(tool.store) > 4 * queue_size + jobs
+    assert all(entry["status"] == "verified" for entry in results)
+    assert len(log.read_text().splitlines()) == len(tool.store)
+    # ebmc was running long before the last mutant was generated
+    assert snapshots[-1]["verify"]["done"] > 0
+    for progress in snapshots:
+        # the queues are bounded, and each stage blocks on a full one
+        assert progress["screen"]["queued"] <= queue_size
+        assert progress["verify"]["queued"] <= queue_size
+        screened = progress["screen"]["done"] + progress["screen"]["dropped"]
+        assert progress["generate"]["done"] - screened <= queue_size + 1
+        assert progress["screen"]["done"] - progress["verify"]["done"] <= queue_size + jobs + 1
+
+
+def test_parse_rejections_are_recorded_and_dropped(tmp_path, stub):
+    ebmc, log = stub
+    output_dir = str(tmp_path / "mutants")
+    tool = SmartVerilogMutation(FIFO, output_dir, seed=1, pack=True)
+    pipeline = CampaignPipeline(tool, "fifo", jobs=4, ebmc_path=ebmc, parse=True)
+    # stands in for pyverilog: the bookkeeping is the same for any verdict
+    pipeline._parse_check = lambda meta_info: PARSE_ERROR if meta_info["mutation_id"] % 3 == 0 else None
+    verified = {MutantPack.mutant_id(entry["file"]) for entry in pipeline.run()}
+
+    assert tool.screen_parse is False
+    assert pipeline.rejected and not verified & set(pipeline.rejected)
+    table = MutantTable.load(output_dir)
+    pack = MutantPack(output_dir)
+    assert set(pack) == verified
+    for mutation_id, reason in pipeline.rejected.items():
+        assert table[mutation_id]["screen"] == reason
+        assert mutation_id not in pack
+    assert all(table[mutation_id]["screen"] is None for mutation_id in verified)
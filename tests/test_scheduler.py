@@ -0,0 +1,133 @@
+# test_scheduler.py
+# VerificationScheduler against a stub ebmc script.
+
+import os
+import time
+import stat
+
+import pytest
+
+from ..scheduler import VerificationScheduler
+
+STUB = """#!/bin/sh
+# stub ebmc: logs every run, then passes, fails or hangs by file name
+echo "$1" >> {log}
+case "$1" in
+  *fail*) exit 1;;
+  *hang*) exec sleep 30;;
+  *spawn*) sleep 30 & echo $! > {pids}; wait;;
+  *slow*) exec sleep 1.5;;
+esac
+exec sleep 0.3
+"""
+
+MODULE = "module top(input a, output y);\nassign y = a;\nendmodule\n"
+
+
+@pytest.fixture
+def stub(tmp_path):
+    log = tmp_path / "ebmc.log"
+    path = tmp_path / "ebmc"
+    path.write_text(STUB.format(log=log, pids=tmp_path / "pids"))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path), log
+
+
+def write_mutants(directory, *names):
+    paths = []
+    for name in names:
+        path = directory / f"mutant_{name}.sv"
+        path.write_text(MODULE)
+        paths.append(str(path))
+    return paths
+
+
+def runs(log):
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_statuses(tmp_path, stub):
+    ebmc, _ = stub
+    files = write_mutants(tmp_path, "1", "2_fail")
+    scheduler = VerificationScheduler("top", jobs=2, ebmc_path=ebmc)
+    results = {entry["file"]: entry["status"] for entry in scheduler.run(files)}
+    assert results == {files[0]: "verified", files[1]: "error"}
+    # the assertion files are cleaned up
+    assert sorted(os.listdir(tmp_path)) == sorted(["ebmc", "ebmc.log", "mutant_1.sv", "mutant_2_fail.sv"])
+
+
+def test_runs_concurrently(tmp_path, stub):
+    ebmc, log = stub
+    files = write_mutants(tmp_path, *range(1, 7))
+    start = time.time()
+    entries = list(VerificationScheduler("top", jobs=6, ebmc_path=ebmc).run(files))
+    elapsed = time.time() - start
+    assert len(entries) == 6 and len(runs(log)) == 6
+    # six 0.3 s runs, one after the other, would take 1.8 s
+    assert elapsed < 1.2
+
+
+def test_timeout(tmp_path, stub):
+    ebmc, _ = stub
+    files = write_mutants(tmp_path, "1_hang", "2")
+    start = time.time()
+    results = {entry["file"]: entry for entry in VerificationScheduler("top", jobs=2, timeout=1, ebmc_path=ebmc).run(files)}
+    assert results[files[0]]["status"] == "timeout"
+    assert results[files[1]]["status"] == "verified"
+    assert time.time() - start < 5
+
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            # a zombie waiting to be reaped has already stopped
+            return stat_file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_timeout_kills_the_children_of_ebmc(tmp_path, stub):
+    ebmc, _ = stub
+    files = write_mutants(tmp_path, "1_spawn")
+    entries = list(VerificationScheduler("top", timeout=1, ebmc_path=ebmc).run(files))
+    assert entries[0]["status"] == "timeout"
+    pid = int((tmp_path / "pids").read_text())
+    deadline = time.time() + 2
+    while alive(pid) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not alive(pid)
+
+
+def test_streams_in_completion_order(tmp_path, stub):
+    ebmc, _ = stub
+    files = write_mutants(tmp_path, "1_slow", "2")
+    order = [entry["file"] for entry in VerificationScheduler("top", jobs=2, ebmc_path=ebmc).run(files)]
+    assert order == [files[1], files[0]]
+
+
+def test_resumes_from_journal(tmp_path, stub):
+    ebmc, log = stub
+    files = write_mutants(tmp_path, "1", "2_fail", "3")
+    journal = str(tmp_path / "journal.jsonl")
+
+    # interrupted after the first result
+    scheduler = VerificationScheduler("top", jobs=1, journal_path=journal, ebmc_path=ebmc)
+    results = scheduler.run(files)
+    first = next(results)
+    results.close()
+    # the queued runs are dropped; at most the next one was already running
+    assert len(runs(log)) <= 2
+
+    scheduler = VerificationScheduler("top", jobs=2, journal_path=journal, ebmc_path=ebmc)
+    entries = list(scheduler.run(files))
+    # the recorded result comes first, without running ebmc again
+    assert entries[0] == first
+    assert [run for run in runs(log) if "mutant_1_" in run] == [runs(log)[0]]
+    total = len(runs(log))
+    assert {entry["file"]: entry["status"] for entry in entries} == {
+        files[0]: "verified", files[1]: "error", files[2]: "verified"}
+
+    # a complete journal runs nothing
+    again = list(VerificationScheduler("top", journal_path=journal, ebmc_path=ebmc).run(files))
+    assert len(runs(log)) == total
+    assert sorted(entry["file"] for entry in again) == sorted(files)
@@ -0,0 +1,39 @@
+# test_table.py
+# MutantTable records, in memory and loaded back from disk.
+
+import os
+
+from ..mutation import SmartVerilogMutation
+from ..table import MutantTable
+
+FIFO = os.path.join(os.path.dirname(__file__), os.pardir, "examples", "fifo.v")
+
+
+def test_records_round_trip(tmp_path):
+    tool = SmartVerilogMutation(FIFO, str(tmp_path), seed=1)
+    records = list(tool.iter_mutants())
+    # group tuples are among the matches
+    assert any(isinstance(value, tuple) for record in records for value in record["match"])
+    loaded = MutantTable.load(str(tmp_path))
+    for table in (tool.table, loaded):
+        assert list(table.values()) == records
+
+
+def test_lines_stripped_as_text():
+    # a no-break space and a file separator are whitespace to str.strip only
+    table = MutantTable(["\xa0\x1cassign y = a & b;\xa0\n"])
+    record = {
+        "mutation_id": 1,
+        "category": "gate",
+        "line": 1,
+        "match": [("a", "&", "b")],
+        "original_line": "assign y = a & b;",
+        "mutated_line": "assign y = a | b;",
+        "digest": "0123456789abcdef",
+        "duplicate_of": None,
+        "screen": None,
+        "live": None,
+        "sampled": None,
+    }
+    table.add(record)
+    assert table[1] == record
@@ -2,6 +2,10 @@
 # 
 # Author: Adwait Godbole (adwait@berkeley.edu)
 
+import re
+import random
+import hashlib
+
 def print_ast(node, indent=0, max_depth=5):
     """
     Recursively print the pyverilog AST structure for exploration.
@@ -21,3 +25,41 @@ def print_ast(node, indent=0, max_depth=5):
     if hasattr(node, 'children'):
         for child in node.children():
             print_ast(child, indent + 1, max_depth)
+
+def derive_rng(seed, *keys):
+    """
+    Return a random.Random stream determined only by `seed` and `keys`.
+    Streams for different keys are independent of each other and of the order
+    (or process) in which they are created, which keeps sharded runs
+    reproducible.
+    """
+    return random.Random(derive_key(seed, *keys))
+
+def derive_key(seed, *keys):
+    """
+    Return a 64-bit value determined only by `seed` and `keys`, e.g. a
+    sampling priority, without the cost of a full random stream.
+    """
+    digest = hashlib.sha256(repr((seed,) + keys).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+# a line comment, a block comment (unterminated: up to the end) or a string
+# literal (up to its closing quote or the end of the line, escapes included)
+COMMENT_RE = re.compile(r'//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)|"(?:\\[\s\S]?|[^"\\\n])*["\n]?')
+COMMENT_BYTES_RE = re.compile(COMMENT_RE.pattern.encode())
+NOT_NEWLINE_RE = re.compile(r"[^\n]")
+NOT_NEWLINE_BYTES_RE = re.compile(rb"[^\n]")
+
+def _blank(m):
+    text = m.group()
+    if isinstance(text, str):
+        return " " * len(text) if "\n" not in text else NOT_NEWLINE_RE.sub(" ", text)
+    return b" " * len(text) if b"\n" not in text else NOT_NEWLINE_BYTES_RE.sub(b" ", text)
+
+def mask_comments(text):
+    """
+    Blank out comments and string literals (keeping newlines), so that
+    offsets in the result match the original text. `text` may also be
+    bytes (or a mapped file), offsets then being byte offsets.
+    """
+    return (COMMENT_RE if isinstance(text, str) else COMMENT_BYTES_RE).sub(_blank, text)